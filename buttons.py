@@ -3,8 +3,10 @@ from discord.ui import Button, View
 from discord import ButtonStyle
 import discord
 import random
+import asyncio
 
 import dialog_manager as dialog
+from exploration import ExplorationStore
 import mapparser
 import player
 
@@ -15,12 +17,15 @@ class WhoamiCommandView(View):
             game_map: mapparser.Map,
             player: player.Player,
             author: discord.User,
-            is_whereami_first: bool = False
+            is_whereami_first: bool = False,
+            exploration: ExplorationStore = None
         ):
         super().__init__(timeout=60.0)
         self.map = game_map
         self.player = player
         self.author = author
+        # rooms shown with "Где я" are marked as explored, `None` if fog of war is disabled
+        self.exploration = exploration
         self.message: discord.Message = None
 
         player_button = Button(
@@ -92,9 +97,13 @@ class WhoamiCommandView(View):
         if self.player.isDead:
             await interaction.response.edit_message(view=self, content="```Ты мёртв```")
             return
+        if self.exploration is not None:
+            self.exploration.visit(self.map, self.player)
         await interaction.response.edit_message(
             view=self,
-            content=dialog.get_player_position_string(self.map, self.player)
+            content=await asyncio.get_running_loop().run_in_executor(
+                None, dialog.get_player_position_string, self.map, self.player
+            )
         )
 
     async def close_button_callback(self, interaction: discord.Interaction):
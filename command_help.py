@@ -30,7 +30,10 @@ admin_commands = {
     "покажи": f"Показать колоду // `{prefix}покажи колоду`",
     "удали": f"Удалить триггер для сообщения // `{prefix}удали уведомление`",
     "спроси": f"Создать опрос для всех/группы // `{prefix}спроси <всех|@группу> [-опции] <сообщение> [варианты с новой строки]`",
-    "экип": f"Показать только экипированные предметы объекта // `{prefix}экип <имя_объекта>`"
+    "экип": f"Показать только экипированные предметы объекта // `{prefix}экип <имя_объекта>`",
+    "обнови права": f"Перечитать админов и выданные команды из конфига // `{prefix}обнови права`",
+    "путь": f'Найти кратчайший путь между объектами или до ближайшей комнаты с торговцем, НПЦ или событием \
+// `{prefix}путь <имя_объекта> <имя_объекта|торговец|нпц|событие>` (имена с пробелами в кавычках)'
 }
 
 aliases = {
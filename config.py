@@ -1,8 +1,9 @@
 from __future__ import annotations
 import configparser
-import json
 import os
 from typing import Union
+import discord
+from storage import JsonStore
 
 class Config:
 
@@ -14,16 +15,55 @@ class Config:
         self.BotConfig = self.Bot(
             token=self.config.get('bot', 'token'),
             prefix=self.config.get('bot', 'prefix', fallback="."),
-            admins=self.config.get('bot', 'admins', fallback=[]),
+            admins=parse_ids(self.config.get('bot', 'admins', fallback="")),
+            channels=parse_ids(self.config.get('bot', 'channels', fallback="")),
             reaction_data_filename=self.config.get(
                 'bot', 'reaction_data', fallback="reaction_triggers.json"
-            )
+            ),
+            reaction_write_delay=self.config.getfloat('bot', 'reaction_write_delay', fallback=1.0),
+            reaction_journal=self.config.getboolean('bot', 'reaction_journal', fallback=False)
         )
 
         self.MapConfig = self.Map(
-            path=self.config.get('map', 'path')
+            path=self.config.get('map', 'path'),
+            watch_interval=self.config.getfloat('map', 'watch_interval', fallback=5.0),
+            watch_debounce=self.config.getfloat('map', 'watch_debounce', fallback=2.0),
+            workers=self.config.getint('map', 'workers', fallback=4),
+            fog_of_war=self.config.getboolean('map', 'fog_of_war', fallback=False),
+            explored_data_filename=self.config.get('map', 'explored_data', fallback="explored_rooms.json"),
+            explored_journal=self.config.getboolean('map', 'explored_journal', fallback=True)
+        )
+
+        self.GatewayConfig = self.Gateway(
+            random_player_selection=self.config.getboolean(
+                'gateway', 'random_player_selection', fallback=True
+            ),
+            group_status=self.config.getboolean('gateway', 'group_status', fallback=True),
+            role_polls=self.config.getboolean('gateway', 'role_polls', fallback=True),
+            chunk_at_startup=self.config.getboolean('gateway', 'chunk_at_startup', fallback=False)
         )
 
+        self.PermissionsConfig = self.read_permissions(self.config)
+
+    def read_permissions(self, config: configparser.ConfigParser) -> Config.Permissions:
+        return self.Permissions(
+            admins=parse_ids(config.get('bot', 'admins', fallback="")),
+            admin_roles=parse_ids(config.get('bot', 'admin_roles', fallback="")),
+            grants={
+                command: parse_ids(ids)
+                for command, ids in (config.items('permissions') if config.has_section('permissions') else [])
+            }
+        )
+
+    def reload_permissions(self):
+        """
+        Re-read admins and command grants from the configuration file
+        """
+        config = configparser.ConfigParser()
+        config.read(self.filename)
+        self.PermissionsConfig = self.read_permissions(config)
+        self.BotConfig.admins = self.PermissionsConfig.admins
+
     def write_config(self):
         with open(self.filename, "w") as f:
             self.config.write(f)
@@ -32,13 +72,27 @@ class Config:
         def __init__(self,
                      token: str,
                      prefix: str,
-                     admins: list[str],
-                     reaction_data_filename: str):
+                     admins: frozenset[int],
+                     channels: frozenset[int],
+                     reaction_data_filename: str,
+                     reaction_write_delay: float,
+                     reaction_journal: bool):
             self.token: str = token
             self.prefix: str = prefix
-            self.admins: list[str] = admins
+            self.admins: frozenset[int] = admins
+            # channels to accept commands from, empty means all channels
+            self.channels: frozenset[int] = channels
             self.reaction_data_filename: str = reaction_data_filename
-            self.__reaction_triggers: list[ReactionTrigger] = []
+            # message id -> trigger
+            self.__reaction_triggers: dict[int, ReactionTrigger] = {}
+            # changes not yet passed to the store
+            self.__pending_changes: list[dict] = []
+            self.__store = JsonStore(
+                self.reaction_data_filename,
+                dump=self.__dump_reaction_triggers,
+                delay=reaction_write_delay,
+                journal=reaction_journal
+            )
 
             if not self.token:
                 raise ValueError("Token must be specified in configuration file.")
@@ -47,8 +101,8 @@ class Config:
                 with open(self.reaction_data_filename, "w", encoding="utf-8") as f:
                     f.write("[]")
 
-            with open(self.reaction_data_filename, "r", encoding="utf-8") as f:
-                raw_triggers: list[dict[str, list[dict]]] = json.load(f)
+            raw_triggers: list[dict[str, list[dict]]]
+            raw_triggers, journal = self.__store.read(default=[])
 
             # serialize reaction triggers
             for trigger in raw_triggers:
@@ -63,19 +117,28 @@ class Config:
                     emoji_list.append(emoji_str)
                     role_ids.append(role_id)
                     messages.append(message)
-                self.__reaction_triggers.append(ReactionTrigger(
+                self.__reaction_triggers[int(message_id)] = ReactionTrigger(
                     message_id=int(message_id),
                     emojis=emoji_list,
                     role_ids=role_ids,
                     messages=messages
-                ))
+                )
+
+            # replay changes made after the file was last written
+            for change in journal:
+                if change["op"] == "set":
+                    self.__set_reaction_trigger(
+                        change["message_id"], change["emoji"], change["role_id"], change["message"]
+                    )
+                elif change["op"] == "remove":
+                    self.__reaction_triggers.pop(change["message_id"], None)
 
         @property
         def reaction_triggers(self) -> list[ReactionTrigger]:
             """
             List of reaction triggers
             """
-            return self.__reaction_triggers
+            return list(self.__reaction_triggers.values())
 
         def set_reaction_trigger(
             self,
@@ -91,6 +154,23 @@ class Config:
             :param message_on_reaction: message on subscription and unsubscribtion
             separated with `/`
             """
+            self.__set_reaction_trigger(
+                reaction_message_id, reaction_emoji, reaction_role_id, message_on_reaction
+            )
+            self.__pending_changes.append({
+                "op": "set",
+                "message_id": reaction_message_id,
+                "emoji": str(reaction_emoji),
+                "role_id": reaction_role_id,
+                "message": message_on_reaction
+            })
+
+        def __set_reaction_trigger(
+            self,
+            reaction_message_id: int,
+            reaction_emoji: str,
+            reaction_role_id: int,
+            message_on_reaction: str):
             search_trigger = self.search_reaction_trigger(reaction_message_id)
             if search_trigger is not None:
                 search_trigger.set_reaction_emoji(
@@ -99,13 +179,12 @@ class Config:
                     message=message_on_reaction
                 )
             else:
-                self.__reaction_triggers.append(ReactionTrigger(
+                self.__reaction_triggers[reaction_message_id] = ReactionTrigger(
                     message_id=reaction_message_id,
                     emojis=[reaction_emoji],
                     role_ids=[reaction_role_id],
                     messages=[message_on_reaction]
-                ))
-
+                )
 
         def search_reaction_trigger(self, message_id: int) -> Union[ReactionTrigger, None]:
             """
@@ -113,10 +192,7 @@ class Config:
             :param message_id: discord message id
             :return: `ReactionTrigger` object or `None` if not found
             """
-            for trigger in self.__reaction_triggers:
-                if trigger.message_id == message_id:
-                    return trigger
-            return None
+            return self.__reaction_triggers.get(message_id)
 
         def remove_reaction_trigger(self, trigger: ReactionTrigger):
             """
@@ -124,26 +200,125 @@ class Config:
             :param trigger: ReactionTrigger
             :return: `True` if trigger was removed else `False`
             """
-            try:
-                self.__reaction_triggers.remove(trigger)
-                return True
-            except ValueError:
+            if self.__reaction_triggers.get(trigger.message_id) is not trigger:
                 return False
+            del self.__reaction_triggers[trigger.message_id]
+            self.__pending_changes.append({"op": "remove", "message_id": trigger.message_id})
+            return True
 
         def write_reaction_triggers_file(self):
-            data_to_write = []
-            for trigger in self.__reaction_triggers:
-                data_to_write.append(trigger.dump_trigger_data())
-            with open(self.reaction_data_filename, "w", encoding="utf-8") as f:
-                json.dump(data_to_write, f, indent=2, ensure_ascii=False)
+            """
+            Persist changes made to reaction triggers.
+            The file is written in the background, changes made in quick succession
+            are written at once. With the journal enabled changes are appended to it instead
+            """
+            changes, self.__pending_changes = self.__pending_changes, []
+            for change in changes:
+                self.__store.append(change)
+
+        def flush_reaction_triggers_file(self):
+            """
+            Write the reaction triggers file right now, e.g. before restarting
+            """
+            self.write_reaction_triggers_file()
+            self.__store.flush()
+
+        def __dump_reaction_triggers(self) -> list[dict]:
+            # called from the writer thread, copy the triggers before iterating
+            return [trigger.dump_trigger_data() for trigger in list(self.__reaction_triggers.values())]
 
     class Map:
-        def __init__(self, path: str):
+        def __init__(self,
+                     path: str,
+                     watch_interval: float,
+                     watch_debounce: float,
+                     workers: int,
+                     fog_of_war: bool,
+                     explored_data_filename: str,
+                     explored_journal: bool):
             self.path: str = path
+            # 0 disables the background map watcher
+            self.watch_interval: float = watch_interval
+            self.watch_debounce: float = watch_debounce
+            # size of the thread pool for map parsing and rendering
+            self.workers: int = workers
+            # show only explored rooms on floor maps
+            self.fog_of_war: bool = fog_of_war
+            self.explored_data_filename: str = explored_data_filename
+            self.explored_journal: bool = explored_journal
 
             if not self.path:
                 raise ValueError("Path must be specified in configuration file.")
 
+    class Gateway:
+        """
+        Gateway intents and member cache profile.
+        Member list and presences are only requested for the commands that need them.
+        """
+        def __init__(self,
+                     random_player_selection: bool,
+                     group_status: bool,
+                     role_polls: bool,
+                     chunk_at_startup: bool):
+            self.random_player_selection: bool = random_player_selection
+            self.group_status: bool = group_status
+            self.role_polls: bool = role_polls
+            # online status of members, used by random player selection
+            self.presences: bool = random_player_selection
+            # member list, used by random player selection, group status and polls for a role
+            self.members: bool = random_player_selection or group_status or role_polls
+            # fetch member lists when connecting instead of on first use
+            self.chunk_at_startup: bool = chunk_at_startup and self.members
+
+
+    class Permissions:
+        """
+        Access to admin commands.
+        Admins are the users listed in `[bot] admins` and members with a role from
+        `[bot] admin_roles`, the `[permissions]` section grants single admin commands
+        to users and roles: `<command>=<user or role id>,...`
+        """
+        def __init__(self,
+                     admins: frozenset[int],
+                     admin_roles: frozenset[int],
+                     grants: dict[str, frozenset[int]]):
+            self.admins: frozenset[int] = admins
+            self.admin_roles: frozenset[int] = admin_roles
+            # command -> user and role ids
+            self.grants: dict[str, frozenset[int]] = grants
+
+        def is_admin(self, user: Union[discord.User, discord.Member]) -> bool:
+            """
+            Check whether a user is an admin
+
+            :param user: discord user or guild member
+            """
+            if user.id in self.admins:
+                return True
+            # users in DMs have no roles
+            return any(role.id in self.admin_roles for role in getattr(user, "roles", ()))
+
+        def allows(self, user: Union[discord.User, discord.Member], command: str) -> bool:
+            """
+            Check whether a user may run an admin command
+
+            :param user: discord user or guild member
+            :param command: command name without the prefix
+            """
+            if self.is_admin(user):
+                return True
+            granted = self.grants.get(command)
+            if not granted:
+                return False
+            return user.id in granted or any(role.id in granted for role in getattr(user, "roles", ()))
+
+
+def parse_ids(value: str) -> frozenset[int]:
+    """
+    Parse a comma-separated list of discord IDs
+    """
+    return frozenset(int(item) for item in value.split(",") if item.strip())
+
 
 class ReactionTrigger:
     def __init__(
@@ -153,9 +328,10 @@ class ReactionTrigger:
         role_ids: list[int],
         messages: list[str]):
         self.__message_id = message_id
-        self.__emojis = emojis
-        self.__role_ids = role_ids
-        self.__messages = messages
+        # emoji -> (role id, message)
+        self.__reactions: dict[str, tuple[int, str]] = {
+            str(emoji): (role_id, message) for emoji, role_id, message in zip(emojis, role_ids, messages)
+        }
 
     def __repr__(self):
         return str(self.__message_id)
@@ -172,20 +348,13 @@ class ReactionTrigger:
         """
         List of emojis and custom emoji ids.
         """
-        return self.__emojis
+        return list(self.__reactions)
 
     def set_reaction_emoji(self, emoji: str, role_id: int, message: str):
         """
         Set or update the emoji, role and message
         """
-        if str(emoji) in self.__emojis:
-            index = self.__emojis.index(str(emoji))
-            self.__role_ids[index] = role_id
-            self.__messages[index] = message
-        else:
-            self.__emojis.append(emoji)
-            self.__role_ids.append(role_id)
-            self.__messages.append(message)
+        self.__reactions[str(emoji)] = (role_id, message)
 
     def get_data_by_emoji(self, emoji: str) -> Union[tuple[int, str], None]:
         """
@@ -193,10 +362,7 @@ class ReactionTrigger:
 
         :returns: role id and assign/deassign message
         """
-        if emoji not in self.__emojis:
-            return None
-        index = self.__emojis.index(emoji)
-        return (self.__role_ids[index], self.__messages[index])
+        return self.__reactions.get(str(emoji))
 
     def dump_trigger_data(self) -> dict:
         """
@@ -204,11 +370,11 @@ class ReactionTrigger:
         `{"message_id": [{"emoji_id_1": role_id, "message": "sub/unsub"}, ...]}`
         """
         dump = {str(self.__message_id): []}
-        for index, value in enumerate(self.__emojis):
+        for emoji, (role_id, message) in list(self.__reactions.items()):
             dump[str(self.__message_id)].append(
                 {
-                    value: self.__role_ids[index],
-                    "message": self.__messages[index]
+                    emoji: role_id,
+                    "message": message
                 }
             )
         return dump
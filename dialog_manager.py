@@ -2,6 +2,7 @@ import re
 from typing import Union
 import discord
 import mapparser
+import navigation
 from player import Player
 from config import Config
 
@@ -55,6 +56,44 @@ def get_player_position_string(game_map: mapparser.Map, player: Player) -> str:
 {game_map.list_doors_string(player)}
 ```'''
 
+# room types that can be used instead of an object name in path queries
+PATH_ROOM_TYPES = {
+    "торговец": mapparser.TileIDs.MERCHANT,
+    "нпц": mapparser.TileIDs.ENEMY,
+    "событие": mapparser.TileIDs.EVENT
+}
+
+def get_path_string(game_map: mapparser.Map, source: str, target: str) -> str:
+    """
+    Describe the shortest path between two objects or from an object to the nearest room of a type
+
+    :param source: name of the object to start from
+    :param target: name of the object or a type of rooms from `PATH_ROOM_TYPES`
+    :raises: MapObjectNotFoundException if an object does not found
+    """
+    start = game_map.get_object_room(source)
+    floor = game_map.get_room_floor(start)
+    if floor is None:
+        return f"{source} не находится на этаже."
+    graph = navigation.get_floor_graph(game_map, floor)
+    try:
+        goal = game_map.get_object_room(target)
+        if game_map.get_room_floor(goal) is not floor:
+            return f"{source} и {target} находятся на разных этажах."
+        path = graph.path(start, goal)
+        if path is not None and len(path) == 1:
+            return f"{source} и {target} в одной комнате."
+    except mapparser.MapObjectNotFoundException:
+        if target.lower() not in PATH_ROOM_TYPES:
+            raise
+        path = graph.nearest_path(start, graph.rooms_with(PATH_ROOM_TYPES[target.lower()]))
+        if path is not None and len(path) == 1:
+            return f"{source} уже в комнате «{target.lower()}»."
+        target = f"ближайшей комнаты «{target.lower()}»"
+    if path is None:
+        return f"Пути от {source} до {target} нет."
+    return f"От {source} до {target} дверей: {len(path) - 1} ({', '.join(navigation.get_directions(path))})."
+
 async def add_reaction_message(
     message: Union[discord.Message, discord.MessageReference],
     config: Config,
@@ -0,0 +1,93 @@
+"""
+Rooms explored by players (fog of war).
+
+Rooms a player visited on a floor are stored as a bitset over the floor's
+rectangle, indexed like mapparser.Map.get_floor_grid: `(y - startY) * width + (x - startX)`.
+Floors are keyed by their name and geometry, so a resized floor starts unexplored.
+"""
+from __future__ import annotations
+import mapparser
+import player
+from storage import JsonStore
+
+
+class ExplorationStore:
+    """
+    Explored rooms of every player, persisted with a write-behind JsonStore.
+    The file looks like `{"player": {"floor@x,y,width": "bitset in hex"}}`
+    """
+    def __init__(self, filename: str, delay: float = 1.0, journal: bool = False):
+        """
+        :param filename: path to the JSON file
+        :param delay: seconds to wait for more changes before writing the file
+        :param journal: append changes to a journal instead of rewriting the file
+        """
+        self.__store = JsonStore(filename, dump=self.__dump, delay=delay, journal=journal)
+        # player name -> floor key -> bitset
+        self.__explored: dict[str, dict[str, int]] = {}
+
+        data, journal = self.__store.read(default={})
+        for playername, floors in data.items():
+            self.__explored[playername] = {key: int(bits, 16) for key, bits in floors.items()}
+        for change in journal:
+            floors = self.__explored.setdefault(change["player"], {})
+            floors[change["floor"]] = floors.get(change["floor"], 0) | (1 << change["room"])
+
+    @staticmethod
+    def __get_floor_room(game_map: mapparser.Map, player: player.Player) -> tuple[str, int]:
+        """
+        Get the floor key and the room index of the player's position
+
+        :return: floor key and room index or `(None, None)` if the player is not on a floor
+        """
+        roomPos = (int(player.position[0]) // 32, int(player.position[1]) // 32)
+        fl = game_map.get_room_floor(roomPos)
+        if fl is None:
+            return None, None
+        startX, startY, width = fl.start[0] // 32, fl.start[1] // 32, fl.size[0] // 32
+        if not 0 <= roomPos[0] - startX < width:
+            return None, None
+        return f"{fl.name}@{startX},{startY},{width}", (roomPos[1] - startY) * width + roomPos[0] - startX
+
+    def visit(self, game_map: mapparser.Map, player: player.Player) -> bool:
+        """
+        Mark the player's room as explored
+
+        :param game_map: the map
+        :param player: the player in question
+        :return: `True` if the room wasn't explored before
+        """
+        key, room = ExplorationStore.__get_floor_room(game_map, player)
+        if key is None:
+            return False
+        floors = self.__explored.setdefault(player.name, {})
+        bits = floors.get(key, 0)
+        if bits >> room & 1:
+            return False
+        floors[key] = bits | (1 << room)
+        self.__store.append({"player": player.name, "floor": key, "room": room})
+        return True
+
+    def get_explored(self, game_map: mapparser.Map, player: player.Player) -> int:
+        """
+        Get the rooms the player explored on their current floor
+
+        :param game_map: the map
+        :param player: the player in question
+        :return: bitset of explored rooms, see mapparser.Map.construct_ascii_map
+        """
+        key, _ = ExplorationStore.__get_floor_room(game_map, player)
+        return self.__explored.get(player.name, {}).get(key, 0)
+
+    def flush(self):
+        """
+        Write the file right now, e.g. before restarting
+        """
+        self.__store.flush()
+
+    def __dump(self) -> dict:
+        # called from the writer thread, copy the dicts before iterating
+        return {
+            playername: {key: format(bits, "x") for key, bits in list(floors.items())}
+            for playername, floors in list(self.__explored.items())
+        }
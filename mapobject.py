@@ -0,0 +1,12 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Union
+
+@dataclass
+class MapObject:
+    name: Union[str, None]
+    position: tuple[str, str] # raw [x, y] attributes, in px
+    size: tuple[int, int] # in px
+    obj_class: Union[str, None]
+    layer: str
+    properties: dict[str, str] = field(default_factory=dict)
@@ -1,20 +1,32 @@
 from __future__ import annotations
 from typing import Union
 from enum import Enum
+import array
 import defusedxml.ElementTree as defused_etree
 import xml.etree.ElementTree as etree
 import os
 import datetime
+import hashlib
+import logging
+import threading
+import asyncio
 from colorama import Fore, Back, Style
 import player
 import floor
+import mapobject
+import mapsnapshot
 import roomobject
 import stringworks
 
 
+_log = logging.getLogger(__name__)
+
+
 class MapObjectException(Exception): pass
 class MapObjectNotFoundException(MapObjectException): pass
 class MapObjectWrongIDException(MapObjectException): pass
+class MapObjectPropertyException(MapObjectException): pass
+class MapTileNotFoundException(Exception): pass
 
 
 class TileIDs(Enum):
@@ -28,30 +40,218 @@ class TileIDs(Enum):
 class Map:
     # name's actually misleading since it's not strictly ASCII
     ASCII_DEFAULT_CHARS = '!"#$%&\'()*+,-./:;<=>?[\\]^_`{|}~0123456789ABCDEFGHIJKLMNOPQRSTUVW'
-
-    def __init__(self, filepath: str):
+    # size of a floor layer chunk (in tiles), Tiled's default for infinite maps
+    CHUNK_SIZE = 16
+    # door directions and offsets of the neighbouring rooms, in the order doors are listed
+    DOORS = (("север", 0, -1), ("юг", 0, 1), ("запад", -1, 0), ("восток", 1, 0))
+    # glyphs and legend entries of tiles on detailed floor maps
+    MAP_GLYPHS = {
+        TileIDs.EMPTY: ("П" + Style.RESET_ALL, "Пусто"),
+        TileIDs.ENEMY: (Fore.RED + "Н" + Style.RESET_ALL, "НПЦ"),
+        TileIDs.MERCHANT: (Fore.YELLOW + "Т" + Style.RESET_ALL, "Торговец"),
+        TileIDs.EVENT: (Fore.GREEN + "С" + Style.RESET_ALL, "Событие")
+    }
+
+    def __init__(self, filepath: str, use_snapshot: bool = True, previous: Map = None):
+        """
+        :param filepath: path to the TMX file
+        :param use_snapshot: load the compiled snapshot of the map if it is up to date
+        :param previous: previously loaded version of the map,
+        unchanged objects, chunks and rooms are reused from it instead of being rebuilt
+        """
         # read the file
-        tree = defused_etree.parse(filepath)
-        self.root = tree.getroot()
-        time = os.path.getmtime(filepath)
+        self.filepath = filepath
+        time = self.__mtime = os.path.getmtime(filepath)
         self.map_datetime = datetime.datetime.fromtimestamp(time).strftime('%H:%M:%S %d/%m/%Y')
 
-    def __search_object(self, objectname: str) -> Union[etree.Element, None]:
+        # content digests of objects and chunks, used by incremental reloads
+        self.__object_digests: dict[bytes, mapobject.MapObject] = {}
+        self.__chunk_digests: dict[tuple[int, int], bytes] = {}
+
+        snapshot = None
+        snapshotPath = mapsnapshot.get_snapshot_path(filepath)
+        # hashing the whole TMX file only pays off if there is a snapshot to check it against
+        if use_snapshot and os.path.exists(snapshotPath):
+            snapshot = mapsnapshot.load(snapshotPath, mapsnapshot.get_digest(filepath))
+        self.from_snapshot = snapshot is not None
+        if snapshot is not None:
+            self.__objects, self.__floors, self.__tiles = snapshot
+            previous = None
+        else:
+            self.__objects, self.__tiles, self.__floors = self.__read_xml(filepath, previous)
+
+        # name -> object index, first match wins for duplicate names
+        self.__object_index: dict[str, mapobject.MapObject] = {}
+        for obj in self.__objects:
+            if obj.name is not None:
+                self.__object_index.setdefault(obj.name, obj)
+        # name -> constructed Player, kept across reloads while the object is unchanged
+        self.__players: dict[str, player.Player] = {}
+        if previous is not None:
+            self.__players = {name: pl for name, pl in previous.__players.items()
+                              if self.__object_index.get(name) is previous.__object_index.get(name)}
+        # room cells whose contents differ from the previous version of the map
+        self.changed_rooms: set[tuple[int, int]] = set()
+        self.__rooms = self.__build_rooms(previous)
+        if previous is not None and \
+           [(fl.start, fl.size, fl.name) for fl in self.__floors] == \
+           [(fl.start, fl.size, fl.name) for fl in previous.__floors]:
+            self.__floors = previous.__floors
+            self.__floor_cells = previous.__floor_cells
+        else:
+            self.__floor_cells = self.__build_floor_cells()
+        # floor -> decoded tile IDs of the floor, see get_floor_grid
+        self.__floor_grids: dict[floor.Floor, list[int]] = {}
+        # floor -> door bitmasks of its rooms, see get_door_masks
+        self.__door_masks: dict[floor.Floor, tuple[int, int, int, bytearray]] = {}
+        # view key -> rendered room, see __get_room_view_key
+        self.__room_renders: dict[tuple, str] = {}
+        if previous is not None:
+            self.__room_renders = {key: render for key, render in previous.__room_renders.items()
+                                   if key[0] not in self.changed_rooms}
+
+    def reload(self) -> Map:
+        """
+        Load the current version of the map file, rebuilding only what has changed
+
+        :return: the new Map object, this one is left untouched
+        """
+        return Map(self.filepath, previous=self)
+
+    def write_snapshot(self) -> bool:
+        """
+        Compile the map into a snapshot stored next to the TMX file
+
+        :return: `False` if nothing was written because the file was modified since the map was loaded
+        :raises: PermissionError if the snapshot is mapped by a loaded map on Windows, see mapsnapshot.dump
+        """
+        digest = mapsnapshot.get_digest(self.filepath)
+        if os.path.getmtime(self.filepath) != self.__mtime:
+            return False
+        mapsnapshot.dump(mapsnapshot.get_snapshot_path(self.filepath), digest,
+                         self.__objects, self.__floors, self.__tiles)
+        return True
+
+    def __read_xml(self, filepath: str, previous: Map = None) -> tuple[list, dict, list]:
+        """
+        Stream the TMX file and extract only what the bot needs,
+        elements are dropped as soon as they are read
+
+        :param filepath: path to the TMX file
+        :param previous: previous version of the map to reuse unchanged objects and chunks from
+        :return: objects, decoded floor layer chunks and floors
+        """
+        objects = []
+        tiles = {}
+        floors = []
+        stack = []
+        for event, elem in defused_etree.iterparse(filepath, events=("start", "end")):
+            if event == "start":
+                stack.append(elem)
+                continue
+            stack.pop()
+            if len(stack) == 2 and elem.tag == "object" and stack[1].tag == "objectgroup":
+                layer = stack[1].attrib["name"]
+                if layer in ["нижний", "средний", "верхний"] or layer.startswith("эффекты"):
+                    objDigest = self.__digest_object(elem, layer)
+                    obj = previous.__object_digests.get(objDigest) if previous is not None else None
+                    if obj is None:
+                        obj = self.__read_object(elem, layer)
+                    self.__object_digests[objDigest] = obj
+                    objects.append(obj)
+                elif layer == "этажи":
+                    floors.append(self.__read_floor(elem))
+            elif len(stack) == 3 and elem.tag == "chunk" and \
+                 stack[1].tag == "layer" and stack[1].attrib["name"] == "пол":
+                chunkPos = (int(elem.attrib["x"]), int(elem.attrib["y"]))
+                if chunkPos not in tiles:
+                    chunkDigest = Map.__digest(elem.text or "")
+                    if previous is not None and previous.__chunk_digests.get(chunkPos) == chunkDigest:
+                        tiles[chunkPos] = previous.__tiles[chunkPos]
+                    else:
+                        tiles[chunkPos] = self.__read_chunk(elem)
+                    self.__chunk_digests[chunkPos] = chunkDigest
+            elif len(stack) != 1 and elem.tag != "chunk":
+                # keep the element until its parent is done with it
+                continue
+            if stack:
+                elem.clear()
+                stack[-1].remove(elem)
+        return objects, tiles, floors
+
+    @staticmethod
+    def __digest(content: str) -> bytes:
+        """
+        Get a fixed-size digest of some content, unlike hash() it doesn't collide in practice,
+        so equal digests can be trusted without keeping the content around
+
+        :param content: the content
+        :return: the digest
+        """
+        return hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+
+    def __digest_object(self, obj: etree.Element, layer: str) -> bytes:
+        """
+        Digest everything an object record is built from, without building it
+
+        :param obj: the object's element
+        :param layer: name of the object's layer
+        :return: the digest, equal for objects with equal records
+        """
+        props = obj.find("properties")
+        return Map.__digest(repr((
+            layer,
+            tuple(obj.attrib.items()),
+            tuple((prop.attrib.get("name"), prop.attrib.get("value"), prop.text)
+                  for prop in props.findall("property")) if props is not None else ()
+        )))
+
+    def __read_object(self, obj: etree.Element, layer: str) -> mapobject.MapObject:
+        """
+        Read an object into a record
+
+        :param obj: the object's element
+        :param layer: name of the object's layer
+        :return: the object
+        """
+        try:
+            props = {prop.attrib["name"]: prop.attrib.get("value") or prop.text
+                        for prop in obj.find("properties").findall("property")}
+        except AttributeError:
+            props = {}
+        return mapobject.MapObject(
+            name=obj.attrib.get("name"),
+            position=(obj.attrib["x"], obj.attrib["y"]),
+            size=(int(float(obj.attrib.get("width", 0))), int(float(obj.attrib.get("height", 0)))),
+            obj_class=obj.attrib.get("class"),
+            layer=layer,
+            properties=props
+        )
+
+    def __search_object(self, objectname: str) -> Union[mapobject.MapObject, None]:
         """
         Search for a object in the map.
+        If there are several objects with the same name, the first one is returned.
 
         :param objectname: the name of the object to search for
-        :return: the object's root element or None if no match found
+        :return: the object or None if no match found
         """
-        for objectgroup in self.root.findall("objectgroup"):
-            if objectgroup.attrib["name"] in ["нижний", "средний", "верхний"] or \
-                objectgroup.attrib["name"].startswith("эффекты"):
-                for obj in objectgroup.findall("object"):
-                    try:
-                        if obj.attrib["name"] == objectname:
-                            return obj
-                    except KeyError:
-                        pass
+        return self.__object_index.get(objectname)
+
+    def get_object_room(self, objectname: str) -> tuple[int, int]:
+        """
+        Get the room a given object is in
+
+        :param objectname: name of the object
+        :return: room position (in tiles)
+        :raises: MapObjectNotFoundException if the object does not found
+        """
+        obj = self.__search_object(objectname)
+
+        if obj is None:
+            raise MapObjectNotFoundException(f"No object with name `{objectname}` found.")
+
+        return (int(float(obj.position[0])) // 32, int(float(obj.position[1])) // 32)
 
     def get_objects_inventory(
             self, 
@@ -70,80 +270,99 @@ class Map:
         if obj is None:
             raise MapObjectNotFoundException(f"No object with name `{objectname}` found.")
 
-        try:
-            props = {prop.attrib["name"]: prop.attrib.get("value") or prop.text
-                        for prop in obj.find("properties").findall("property")}
-        except AttributeError:
-            props = {}
-
-        return player.Player.format_inventory_list(props.get("Инвентарь", "").split("\n"), show_equipped_only)
+        return player.Player.format_inventory_list(obj.properties.get("Инвентарь", "").split("\n"), show_equipped_only)
 
     def get_player(self, playername: str, playerID: str) -> player.Player:
         """
         Get serialized Player object
+        Players are cached, so the same object is returned until the map object changes
 
         :param playername: the name of the player to search for
         :param playerID: Discord id of the player
         :return: player.Player object
         :raises: MapObjectNotFoundException if player not found
         :raises: MapObjectWrongIDException if expected playerID
+        :raises: MapObjectPropertyException if a property of the player can't be parsed
         """
         pl = self.__search_object(playername)
         if not pl:
             raise MapObjectNotFoundException(f"No object with name `{playername}` found.")
 
-        name = pl.attrib["name"]
-        position = [pl.attrib["x"], pl.attrib["y"]]
-        try:
-            props = {prop.attrib["name"]: prop.attrib.get("value") or prop.text
-                        for prop in pl.find("properties").findall("property")}
-        except AttributeError:
-            props = {}
+        name = pl.name
+        position = list(pl.position)
+        props = pl.properties
 
         foundPlayerID = props.get("ID игрока", "")
         if str(playerID) != str(foundPlayerID):
             raise MapObjectWrongIDException(f"ID `{foundPlayerID}` expected for `{playername}`, " +
                                             f"got {playerID} instead.")
 
-        inventory = player.Player.format_inventory_list(props.get("Инвентарь", "").split("\n"))
-
-        hpString          = props.get("Очки Здоровья", "100/100 (100)")
-        hp                = int(hpString.split()[0].split("/")[0])
-        maxHP             = float(hpString.split()[0].split("/")[1])
-        trueHP            = int(hpString.split()[1][1:-1])
-        mpString          = props.get("Очки Маны", "100/100 (100)")
-        mp                = int(mpString.split()[0].split("/")[0])
-        maxMP             = float(mpString.split()[0].split("/")[1])
-        trueMP            = int(mpString.split()[1][1:-1])
-        sp                = float(props.get("Очки Души", "3"))
-        rerolls           = int(props.get("Рероллы", "2"))
-        active_abilities  = props.get("Навыки", "").split("\n")
-        passive_abilities = props.get("Особенности", "").split("\n")
-        level             = int(props.get("Уровень", "1"))
-        frags             = props.get("Фраги", "0/4")
-        group             = props.get("Группа", "")
-        isBlind           = props.get("Ослеплён", "false").lower() in ["true", "1"]
-        isDead            = pl.attrib.get("class", "Игрок").lower() == "труп"
-        return player.Player(
-            position=position,
-            name=name,
-            inventory=inventory,
-            HP=hp,
-            maxHP=maxHP,
-            trueHP=trueHP,
-            MP=mp,
-            maxMP=maxMP,
-            trueMP=trueMP,
-            SP=sp,
-            level=level,
-            frags=frags,
-            active_abilities=active_abilities,
-            passive_abilities=passive_abilities,
-            rerolls=rerolls,
-            group=group,
-            isBlind=isBlind,
-            isDead=isDead
-        )
+        cached = self.__players.get(playername)
+        if cached is not None:
+            return cached
+
+        try:
+            self.__players[playername] = player.Player.from_properties(position, name, pl.obj_class, props)
+        except (ValueError, IndexError) as e:
+            raise MapObjectPropertyException(f"Malformed properties of `{playername}`: {e}") from e
+        return self.__players[playername]
+
+    def get_players(
+            self,
+            players: list[tuple[str, str]]
+        ) -> tuple[list[Union[player.Player, None]], list[Union[MapObjectException, None]]]:
+        """
+        Get serialized Player objects for many players at once
+
+        :param players: list of (player name, Discord id) pairs
+        :return: players and errors, both in the order of `players`;
+        for each entry either the player or the error is None
+        """
+        found = []
+        errors = []
+        for playername, playerID in players:
+            try:
+                found.append(self.get_player(playername, playerID))
+                errors.append(None)
+            except MapObjectException as e:
+                found.append(None)
+                errors.append(e)
+        return found, errors
+
+    def __build_rooms(self, previous: Map = None) -> dict[tuple[int, int], list[roomobject.RoomObject]]:
+        """
+        Bucket the objects by the room they are in
+
+        :param previous: previous version of the map to reuse unchanged rooms from
+        :return: room objects keyed by room position (in tiles), in document order
+        """
+        self.__room_records: dict[tuple[int, int], list[mapobject.MapObject]] = {}
+        for obj in self.__objects:
+            cell = (int(float(obj.position[0])) // 32, int(float(obj.position[1])) // 32)
+            self.__room_records.setdefault(cell, []).append(obj)
+
+        rooms = {}
+        for cell, records in self.__room_records.items():
+            if previous is not None:
+                previousRecords = previous.__room_records.get(cell, [])
+                if len(previousRecords) == len(records) and \
+                   all(a is b for a, b in zip(previousRecords, records)):
+                    rooms[cell] = previous.__rooms[cell]
+                    continue
+            self.changed_rooms.add(cell)
+            rooms[cell] = [roomobject.RoomObject(
+                obj.name if obj.name is not None else "???",
+                (int(float(obj.position[0])) % 32 // 4, int(float(obj.position[1])) % 32 // 4),
+                (obj.size[0] // 4, obj.size[1] // 4),
+                obj.obj_class or "",
+                obj.layer,
+                hidden=obj.properties.get("Скрыт", "false") == "true",
+                owner=obj.properties.get("Владелец") or "",
+                group=obj.properties.get("Группа") or ""
+            ) for obj in records]
+        if previous is not None:
+            self.changed_rooms.update(cell for cell in previous.__rooms if cell not in rooms)
+        return rooms
 
     def get_same_room_objects(self, player: player.Player) -> list:
         """
@@ -153,48 +372,48 @@ class Map:
         :param player: the player in question
         :return: list of objects
         """
-        roomPos = [ int(player.position[0])-int(player.position[0]) % 32,
-                    int(player.position[1])-int(player.position[1]) % 32]
-        objects = []
-        for objectgroup in self.root.findall("objectgroup"):
-            if objectgroup.attrib["name"] in ["нижний", "средний", "верхний"] or \
-               objectgroup.attrib["name"].startswith("эффекты"):
-                for obj in objectgroup.findall("object"):
-                    objX, objY = int(obj.attrib["x"]), int(obj.attrib["y"])
-                    if objX-objX % 32 == roomPos[0] and objY-objY % 32 == roomPos[1]:
-                        name = obj.attrib.get("name", "???")
-                        try:
-                            props = {prop.attrib["name"]: prop.attrib.get("value")
-                                for prop in obj.find("properties").findall("property")}
-                        except AttributeError:
-                            props = {}
-                        group = props.get("Группа", "")
-                        hidden = True if props.get("Скрыт", "false") == "true" else False
-                        owner = props.get("Владелец", "")
-                        if  (not hidden) or \
-                            (owner != "" and owner == player.name) or \
-                            (group != "" and group == player.group) or \
-                            (name != "???" and name == player.name):
-                            objX, objY = objX % 32 // 4, objY % 32 // 4
-                            width = int(obj.attrib.get("width", 0)) // 4
-                            height = int(obj.attrib.get("height", 0)) // 4
-                            layer = objectgroup.attrib["name"]
-                            obj = roomobject.RoomObject(obj.attrib.get("name", "???"),
-                                                        (objX, objY),
-                                                        (width, height),
-                                                        obj.attrib.get("class", ""),
-                                                        layer)
-                            objects.append(obj)
-
+        roomPos = (int(player.position[0]) // 32, int(player.position[1]) // 32)
+        objects = [obj for obj in self.__rooms.get(roomPos, []) if obj.is_visible_to(player)]
         return sorted(objects, key=lambda x: [-x.layer, x.position[0], x.position[1]])
 
+    def __get_room_view_key(self, player: player.Player) -> tuple:
+        """
+        Get the key of the player's view of their room.
+        Players with the same key see the same render of the room
+
+        :param player: the player in question
+        :return: room cell, name and group of the player if anything in the room depends on them
+        and position of the player in the room if they are blind
+        """
+        cell = (int(player.position[0]) // 32, int(player.position[1]) // 32)
+        name = group = None
+        for obj in self.__rooms.get(cell, []):
+            if obj.name == player.name or (obj.hidden and obj.owner == player.name):
+                # the player is highlighted or sees objects they own
+                name = player.name
+            if obj.hidden and obj.group != "" and obj.group == player.group:
+                group = player.group
+        blindPos = None
+        if player.isBlind:
+            blindPos = (int(player.position[0]) % 32 // 4, int(player.position[1]) % 32 // 4)
+        return cell, name, group, blindPos
+
     def construct_ascii_room(self, player: player.Player) -> str:
         """
         Generates an ASCII string representation of a room
+        Renders are cached per room and view, see __get_room_view_key
 
         :param player: the player object
         :returns: an ASCII string representation of a room
         """
+        key = self.__get_room_view_key(player)
+        render = self.__room_renders.get(key)
+        if render is None:
+            render = self.__render_room(player)
+            self.__room_renders[key] = render
+        return render
+
+    def __render_room(self, player: player.Player) -> str:
         objlist = self.get_same_room_objects(player)
         playerPos = [ int(player.position[0]) % 32 // 4,
                       int(player.position[1]) % 32 // 4]
@@ -291,6 +510,38 @@ class Map:
         legend = "\n".join([f"{char}: {', '.join(objs)}" for char, objs in legend.items()])
         return f"{representation}\n\n{legend}"
 
+    def get_door_masks(self, floor: floor.Floor) -> tuple[int, int, int, bytearray]:
+        """
+        Get the doors of every room on a floor, computed once per floor
+
+        :param floor: the floor
+        :return: first room cell and width of the floor (in rooms) and door bitmasks
+        of its rooms, row by row, see Map.DOORS
+        """
+        masks = self.__door_masks.get(floor)
+        if masks is not None:
+            return masks
+        startX, startY = floor.start[0] // 32, floor.start[1] // 32
+        width = (floor.end[0] - 1) // 32 + 1 - startX
+        height = (floor.end[1] - 1) // 32 + 1 - startY
+        doors = bytearray(max(width, 0) * max(height, 0))
+        for y in range(startY, startY + height):
+            for x in range(startX, startX + width):
+                mask = 0
+                for bit, (_, dx, dy) in enumerate(Map.DOORS):
+                    try:
+                        tile = self.__get_tile([x + dx, y + dy])
+                    except (MapTileNotFoundException, ValueError):
+                        # unknown tiles or a missing chunk, not a room
+                        continue
+                    if tile not in (TileIDs.NULL, TileIDs.ABYSS) and \
+                       getattr(self.__get_floor_tile((x + dx, y + dy)), "name", None) == floor.name:
+                        mask |= 1 << bit
+                doors[(y - startY) * width + x - startX] = mask
+        masks = (startX, startY, width, doors)
+        self.__door_masks[floor] = masks
+        return masks
+
     def __list_doors(self, player: player.Player) -> list:
         """
         List available doors in the same room as the player
@@ -305,35 +556,19 @@ class Map:
         floor = self.__get_floor_player(player)
         if floor is None:
             return []
+        startX, startY, width, masks = self.get_door_masks(floor)
+        mask = masks[(roomPos[1] - startY) * width + roomPos[0] - startX]
         doors = []
-        if self.__get_tile([roomPos[0], roomPos[1]-1]) not in (TileIDs.NULL, TileIDs.ABYSS) and \
-            getattr(self.__get_floor_tile((roomPos[0], roomPos[1]-1)), "name", None) == floor.name:
-            if player.isBlind:
-                if playerPos[1] == 0:
-                    doors.append("север")
-            else:
-                doors.append("север")
-        if self.__get_tile([roomPos[0], roomPos[1]+1]) not in (TileIDs.NULL, TileIDs.ABYSS) and \
-            getattr(self.__get_floor_tile((roomPos[0], roomPos[1]+1)), "name", None) == floor.name:
-            if player.isBlind:
-                if playerPos[1] == 7:
-                    doors.append("юг")
-            else:
-                doors.append("юг")
-        if self.__get_tile([roomPos[0]-1, roomPos[1]]) not in (TileIDs.NULL, TileIDs.ABYSS) and \
-            getattr(self.__get_floor_tile((roomPos[0]-1, roomPos[1])), "name", None) == floor.name:
-            if player.isBlind:
-                if playerPos[0] == 0:
-                    doors.append("запад")
-            else:
-                doors.append("запад")
-        if self.__get_tile([roomPos[0]+1, roomPos[1]]) not in (TileIDs.NULL, TileIDs.ABYSS) and \
-            getattr(self.__get_floor_tile((roomPos[0]+1, roomPos[1])), "name", None) == floor.name:
-            if player.isBlind:
-                if playerPos[0] == 7:
-                    doors.append("восток")
-            else:
-                doors.append("восток")
+        for bit, (direction, dx, dy) in enumerate(Map.DOORS):
+            if not mask & (1 << bit):
+                continue
+            # blind players only find the doors next to them
+            if player.isBlind and not (
+                (dx == 0 or playerPos[0] == (0 if dx < 0 else 7)) and
+                (dy == 0 or playerPos[1] == (0 if dy < 0 else 7))
+            ):
+                continue
+            doors.append(direction)
         return doors
 
     def list_doors_string(self, player: player.Player) -> str:
@@ -356,76 +591,135 @@ class Map:
             resp = "Двери ведут на 4 стороны света."
         return resp
 
+    def __read_chunk(self, chunk: etree.Element) -> array.array:
+        """
+        Decode a chunk of the floor layer
+
+        :param chunk: the chunk's element
+        :return: tile IDs of the chunk, row by row
+        """
+        return array.array("I", [int(tile) for tile in chunk.text.split(",")])
+
     def __get_tile(self, pos: list) -> TileIDs:
         """
         Get tile ID at given position
 
         :param pos: the position
         :returns: tile ID
+        :raises: MapTileNotFoundException if there is no chunk at the position
+        :raises: ValueError if the tile ID is unknown
+        """
+        x, y = int(pos[0]), int(pos[1])
+        chunk = self.__tiles.get((x - x % Map.CHUNK_SIZE, y - y % Map.CHUNK_SIZE))
+        if chunk is None:
+            raise MapTileNotFoundException("Unknown tile at position " + str(pos))
+        return TileIDs(chunk[(y % Map.CHUNK_SIZE) * Map.CHUNK_SIZE + x % Map.CHUNK_SIZE])
+
+    def get_floor_grid(self, floor: floor.Floor) -> list[int]:
+        """
+        Get tile IDs of a floor, decoded once per floor
+
+        :param floor: the floor
+        :return: tile IDs of the floor's rectangle, row by row
+        :raises: MapTileNotFoundException if a chunk of the floor is missing
+        """
+        grid = self.__floor_grids.get(floor)
+        if grid is not None:
+            return grid
+        startX, startY = floor.start[0] // 32, floor.start[1] // 32
+        endX, endY = startX + floor.size[0] // 32, startY + floor.size[1] // 32
+        grid = []
+        for y in range(startY, endY):
+            rowOffset = (y % Map.CHUNK_SIZE) * Map.CHUNK_SIZE
+            x = startX
+            while x < endX:
+                chunkX = x - x % Map.CHUNK_SIZE
+                chunk = self.__tiles.get((chunkX, y - y % Map.CHUNK_SIZE))
+                if chunk is None:
+                    raise MapTileNotFoundException("Unknown tile at position " + str([x, y]))
+                stop = min(endX, chunkX + Map.CHUNK_SIZE)
+                grid.extend(chunk[rowOffset + x - chunkX:rowOffset + stop - chunkX])
+                x = stop
+        self.__floor_grids[floor] = grid
+        return grid
+
+    @staticmethod
+    def __get_map_glyphs(level: int) -> tuple[list[str], list[Union[tuple[str, str], None]]]:
+        """
+        Get the glyphs and legend entries tiles are drawn with
+
+        :param level: detail level of the map
+        :return: glyphs and legend entries, indexed by tile ID
         """
-        chunkPos = [int(pos[0])-int(pos[0]) % 16,
-                    int(pos[1])-int(pos[1]) % 16]
-        for layer in self.root.findall("layer"):
-            if layer.attrib["name"] == "пол":
-                for chunk in layer.find('data').findall("chunk"):
-                    if chunk.attrib["x"] == str(chunkPos[0]) and chunk.attrib["y"] == str(chunkPos[1]):
-                        data = chunk.text
-                        data = data.replace("\n", "")
-                        data = data.replace(" ", "")
-                        data = data.split(",")
-                        data = [int(tile) for tile in data]
-                        return TileIDs(data[(pos[1] % 16) * 16 + pos[0] % 16])
-        raise Exception("Unknown tile at position " + str(pos))
-
-    def construct_ascii_map(self, player: player.Player, level: int = 0) -> str:
+        glyphs = [""] * len(TileIDs)
+        legend = [None] * len(TileIDs)
+        for tile in TileIDs:
+            if tile in (TileIDs.NULL, TileIDs.ABYSS):
+                glyphs[tile.value] = " "
+            elif level >= 2 and tile in Map.MAP_GLYPHS:
+                glyphs[tile.value], _ = legend[tile.value] = Map.MAP_GLYPHS[tile]
+            else:
+                glyphs[tile.value], _ = legend[tile.value] = ("#", "???")
+        return glyphs, legend
+
+    def construct_ascii_map(self, player: player.Player, level: int = 0, explored: int = None) -> str:
         """
         Construct the map of a floor the player is in, represented as ASCII art
 
         :param player: the player in question
+        :param explored: bitset of rooms the player explored, indexed like get_floor_grid,
+        other rooms are not shown. All rooms are shown if `None`
         :return: the map
         """
         floor = self.__get_floor_player(player)
         if floor is None:
             return "Карта пуста."
-        floorStart = [floor.start[0] // 32, floor.start[1] // 32]
-        floorSize = [floor.size[0] // 32, floor.size[1] // 32]
-        representation = ''
-        legend = {}
-        for y in range(floorSize[1]):
-            for x in range(floorSize[0]):
-                tile = self.__get_tile([floorStart[0]+x, floorStart[1]+y])
-                character = Back.WHITE if level >= 2 and self.get_player_floor_coords(player) == (x, y) else ""
-                if tile in (TileIDs.NULL, TileIDs.ABYSS):
-                    representation += ' '
-                elif level >= 2 and tile == TileIDs.EVENT:
-                    character += Fore.GREEN + "С" + Style.RESET_ALL
-                    representation += character
-                    legend[Fore.GREEN + "С" + Style.RESET_ALL] = "Событие"
-                elif level >= 2 and tile == TileIDs.ENEMY:
-                    character += Fore.RED + "Н" + Style.RESET_ALL
-                    representation += character
-                    legend[Fore.RED + "Н" + Style.RESET_ALL] = "НПЦ"
-                elif level >= 2 and tile == TileIDs.MERCHANT:
-                    character += Fore.YELLOW + "Т" + Style.RESET_ALL
-                    representation += character
-                    legend[Fore.YELLOW + "Т" + Style.RESET_ALL] = "Торговец"
-                elif level >= 2 and tile == TileIDs.EMPTY:
-                    character += "П" + Style.RESET_ALL
-                    representation += character
-                    legend["П" + Style.RESET_ALL] = "Пусто"
-                elif level == 1 and self.get_player_floor_coords(player) == (x, y):
-                    chararter = Back.WHITE + Fore.BLACK + player.name[0].upper() + Style.RESET_ALL
-                    representation += chararter
-                    legend[chararter] = player.name
-                else:
-                    representation += '#'
-                    legend["#"] = "???"
-
-                if character.startswith(Back.WHITE):
-                    legend[f"{Back.WHITE} {Style.RESET_ALL}"] = player.name
+        width = floor.size[0] // 32
+        grid = self.get_floor_grid(floor)
+        if explored is not None:
+            grid = [tile if explored >> index & 1 else TileIDs.NULL.value for index, tile in enumerate(grid)]
+        glyphs, glyphLegend = Map.__get_map_glyphs(level)
+        if grid and max(grid) >= len(glyphs):
+            # unknown tile ID, raises ValueError
+            TileIDs(max(grid))
+        cells = [glyphs[tile] for tile in grid]
+
+        # legend entries in the order their first tiles are drawn in
+        entries = []
+        playerIndex = None
+        if level >= 1:
+            playerX, playerY = self.get_player_floor_coords(player)
+            if 0 <= playerX < width and 0 <= playerY * width + playerX < len(grid):
+                playerIndex = playerY * width + playerX
+        if playerIndex is not None:
+            tile = grid[playerIndex]
+            empty = tile in (TileIDs.NULL.value, TileIDs.ABYSS.value)
+            if level == 1 and not empty:
+                cells[playerIndex] = Back.WHITE + Fore.BLACK + player.name[0].upper() + Style.RESET_ALL
+                entries.append((playerIndex, 0, cells[playerIndex], player.name))
+            elif level >= 2:
+                if not empty and TileIDs(tile) in Map.MAP_GLYPHS:
+                    cells[playerIndex] = Back.WHITE + cells[playerIndex]
+                entries.append((playerIndex, 1, f"{Back.WHITE} {Style.RESET_ALL}", player.name))
+        for tile, entry in enumerate(glyphLegend):
+            if entry is None:
+                continue
+            try:
+                first = grid.index(tile)
+                if level == 1 and first == playerIndex and cells[first] != glyphs[tile]:
+                    # the player is drawn over the first tile, look for the next one
+                    first = grid.index(tile, first + 1)
+            except ValueError:
+                continue
+            entries.append((first, 0) + entry)
 
-            representation += '\n'
-        legend = "\n".join([f"{char}: {''.join(objs)}" for char, objs in legend.items()])
+        legend = {}
+        for _, _, char, name in sorted(entries, key=lambda entry: entry[:2]):
+            legend.setdefault(char, name)
+        representation = "".join(
+            "".join(cells[y:y + width]) + "\n" for y in range(0, len(cells), width)
+        ) if width > 0 else ""
+        legend = "\n".join([f"{char}: {name}" for char, name in legend.items()])
         return f"{representation}\n\n{legend if level > 0 else ''}"
 
     def get_player_floor_coords(self, player: player.Player) -> tuple[int, int]:
@@ -441,6 +735,32 @@ class Map:
         floorStart = [floor.start[0] // 32, floor.start[1] // 32]
         return (roomPos[0]-floorStart[0], roomPos[1]-floorStart[1])
 
+    def __read_floor(self, obj: etree.Element) -> floor.Floor:
+        """
+        Read a floor from an object of the floor group
+
+        :param obj: the object's element
+        :return: the floor
+        """
+        startX, startY = int(float(obj.attrib["x"])), int(float(obj.attrib["y"]))
+        sizeX, sizeY = int(float(obj.attrib["width"])), int(float(obj.attrib["height"]))
+        return floor.Floor((startX, startY), (sizeX, sizeY), obj.attrib.get("name", "???"))
+
+    def __build_floor_cells(self) -> dict[tuple[int, int], list[floor.Floor]]:
+        """
+        Bucket the floors by the room cells they overlap
+
+        :return: floors keyed by room position (in tiles), in document order
+        """
+        cells = {}
+        for fl in self.__floors:
+            if fl.size[0] <= 0 or fl.size[1] <= 0:
+                continue
+            for x in range(fl.start[0] // 32, (fl.end[0] - 1) // 32 + 1):
+                for y in range(fl.start[1] // 32, (fl.end[1] - 1) // 32 + 1):
+                    cells.setdefault((x, y), []).append(fl)
+        return cells
+
     def __get_floor_px(self, objPos) -> floor.Floor:
         """
         Get the floor at given coordinates (in px)
@@ -448,17 +768,12 @@ class Map:
         :param objPos: object's position (in px)
         :return: the floor or None if not on a floor
         """
-        for objectgroup in self.root.findall("objectgroup"):
-            if objectgroup.attrib["name"] == "этажи":
-                for obj in objectgroup.findall("object"):
-                    startX, startY = int(obj.attrib["x"]), int(obj.attrib["y"])
-                    sizeX, sizeY = int(obj.attrib["width"]), int(obj.attrib["height"])
-                    if  startX <= objPos[0] and \
-                        startY <= objPos[1] and \
-                        startX + sizeX > objPos[0] and \
-                        startY + sizeY > objPos[1]:
-                        name = obj.attrib.get("name", "???")
-                        return floor.Floor((startX, startY), (sizeX, sizeY), name)
+        for fl in self.__floor_cells.get((objPos[0] // 32, objPos[1] // 32), ()):
+            if  fl.start[0] <= objPos[0] and \
+                fl.start[1] <= objPos[1] and \
+                fl.end[0] > objPos[0] and \
+                fl.end[1] > objPos[1]:
+                return fl
 
     def __get_floor_tile(self, tilePos) -> floor.Floor:
         """
@@ -469,6 +784,15 @@ class Map:
         """
         return self.__get_floor_px([tilePos[0]*32, tilePos[1]*32])
 
+    def get_room_floor(self, roomPos: tuple[int, int]) -> floor.Floor:
+        """
+        Get the floor a room is on
+
+        :param roomPos: room position (in tiles)
+        :return: the floor or None if not on a floor
+        """
+        return self.__get_floor_tile(roomPos)
+
     def __get_floor_player(self, player: player.Player) -> floor.Floor:
         """
         Get the floor the player is on
@@ -497,3 +821,94 @@ class Map:
         if floor.name != "???":
             return f'Ты находишься в локации "{floor.name}".'
         return "Неясно, где ты находишься."
+
+
+class MapProvider:
+    """
+    Shares a single parsed Map between commands.
+
+    The map is re-parsed only when the file's mtime, size or inode changes.
+    While watch() is running the file is re-parsed in the background
+    and commands always get the latest ready map without waiting for a parse.
+    """
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.hits = 0
+        self.misses = 0
+        self.__map: Union[Map, None] = None
+        self.__stamp: Union[tuple, None] = None
+        self.__lock = threading.Lock()
+        self.__watching = False
+
+    def __get_stamp(self) -> tuple:
+        stat = os.stat(self.filepath)
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def get_map(self) -> Map:
+        """
+        Get the parsed map, re-parsing it if the file has changed
+
+        :return: the shared Map object
+        """
+        if self.__watching and self.__map is not None:
+            self.hits += 1
+            return self.__map
+        stamp = self.__get_stamp()
+        with self.__lock:
+            if self.__map is not None and (self.__watching or self.__stamp == stamp):
+                self.hits += 1
+                return self.__map
+            self.misses += 1
+            self.__map = self.__map.reload() if self.__map is not None else Map(self.filepath)
+            self.__stamp = stamp
+            return self.__map
+
+    def invalidate(self):
+        """
+        Drop the cached map, the next get_map() call will re-parse the file.
+        While watching, the current map is kept until the watcher replaces it.
+        """
+        with self.__lock:
+            if not self.__watching:
+                self.__map = None
+            self.__stamp = None
+
+    async def watch(self, interval: float = 5.0, debounce: float = 2.0):
+        """
+        Poll the map file and swap in a freshly parsed map when it changes.
+        The file is parsed in a worker thread only after it has stopped changing
+        for `debounce` seconds, and a parse that fails or races with another save
+        leaves the current map in place.
+
+        :param interval: seconds between checks of the file
+        :param debounce: seconds the file must stay unchanged before parsing
+        """
+        if self.__watching:
+            return
+        self.__watching = True
+        loop = asyncio.get_running_loop()
+        try:
+            if self.__map is None:
+                await loop.run_in_executor(None, self.get_map)
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    stamp = self.__get_stamp()
+                    if stamp == self.__stamp:
+                        continue
+                    # wait for Tiled to finish writing the file
+                    await asyncio.sleep(debounce)
+                    if self.__get_stamp() != stamp:
+                        continue
+                    game_map = await loop.run_in_executor(None, self.__map.reload)
+                    if self.__get_stamp() != stamp:
+                        continue
+                except Exception as e:
+                    _log.warning("Failed to reload the map: %s", e)
+                    continue
+                with self.__lock:
+                    self.__map = game_map
+                    self.__stamp = stamp
+                self.misses += 1
+        finally:
+            self.__watching = False
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Compiled map snapshots.
+
+A snapshot holds everything mapparser.Map extracts from a TMX file (objects with
+parsed properties, floors and decoded floor layer chunks) and is stored next to
+the map as `<map>.snapshot`. It is keyed by the SHA-256 of the TMX file, so a
+snapshot of an older version of the map is never used.
+
+Layout:
+    magic (8 bytes) | byteorder (1 byte) | TMX digest (32 bytes) | metadata length (uint32)
+    metadata (UTF-8 JSON) | padding to 4 bytes | chunk tiles (native uint32)
+"""
+from __future__ import annotations
+from typing import Union
+import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import floor
+import mapobject
+
+MAGIC = b"DOBLMAP1"
+HEADER = struct.Struct("<8sc32sI")
+TILE_TYPECODE = "I"
+
+
+def get_snapshot_path(filepath: str) -> str:
+    """
+    Get the snapshot path for a given TMX file
+    """
+    return filepath + ".snapshot"
+
+def get_digest(filepath: str) -> bytes:
+    """
+    Get the digest the snapshot of a TMX file is keyed by
+
+    :param filepath: path to the TMX file
+    """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.digest()
+
+def dump(
+        path: str,
+        digest: bytes,
+        objects: list[mapobject.MapObject],
+        floors: list[floor.Floor],
+        tiles: dict[tuple[int, int], array.array]
+    ):
+    """
+    Write a snapshot, replacing the old one atomically.
+    On Windows a snapshot can't be replaced while a loaded map still maps it
+    (e.g. the bot is running), PermissionError is raised then
+
+    :param path: snapshot path
+    :param digest: digest of the TMX file
+    :param objects: map objects
+    :param floors: map floors
+    :param tiles: decoded floor layer chunks keyed by chunk origin
+    """
+    chunks = []
+    offset = 0
+    for (chunkX, chunkY), chunk in tiles.items():
+        chunks.append([chunkX, chunkY, offset, len(chunk)])
+        offset += len(chunk)
+    meta = json.dumps({
+        "objects": [[obj.name, obj.position[0], obj.position[1], obj.size[0], obj.size[1],
+                     obj.obj_class, obj.layer, obj.properties] for obj in objects],
+        "floors": [[fl.start[0], fl.start[1], fl.size[0], fl.size[1], fl.name] for fl in floors],
+        "chunks": chunks
+    }, ensure_ascii=False).encode("utf-8")
+    byteorder = b"<" if sys.byteorder == "little" else b">"
+    padding = -(HEADER.size + len(meta)) % 4
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, byteorder, digest, len(meta)))
+        f.write(meta)
+        f.write(b"\0" * padding)
+        for chunk in tiles.values():
+            f.write(array.array(TILE_TYPECODE, chunk).tobytes())
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        os.remove(tmp_path)
+        raise
+
+def load(path: str, digest: bytes) -> Union[tuple[list, list, dict], None]:
+    """
+    Load a snapshot by memory-mapping it, tiles are not copied out of the mapping,
+    so the file stays mapped for as long as the tiles are alive
+
+    :param path: snapshot path
+    :param digest: digest of the TMX file
+    :return: objects, floors and tiles or None if there is no fresh snapshot
+    """
+    try:
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    if len(mapped) < HEADER.size:
+        return None
+    magic, byteorder, snapshotDigest, metaLength = HEADER.unpack_from(mapped)
+    if magic != MAGIC or snapshotDigest != digest or \
+       byteorder != (b"<" if sys.byteorder == "little" else b">"):
+        return None
+
+    meta = json.loads(mapped[HEADER.size:HEADER.size + metaLength].decode("utf-8"))
+    objects = [mapobject.MapObject(name, (x, y), (width, height), obj_class, layer, properties)
+               for name, x, y, width, height, obj_class, layer, properties in meta["objects"]]
+    floors = [floor.Floor((x, y), (width, height), name) for x, y, width, height, name in meta["floors"]]
+
+    dataStart = HEADER.size + metaLength
+    dataStart += -dataStart % 4
+    data = memoryview(mapped)[dataStart:].cast(TILE_TYPECODE)
+    tiles = {(chunkX, chunkY): data[offset:offset + count]
+             for chunkX, chunkY, offset, count in meta["chunks"]}
+    return objects, floors, tiles
+
+
+if __name__ == '__main__':
+    import mapparser
+
+    if len(sys.argv) != 2:
+        print(f"Usage: {sys.argv[0]} <path to tmx file>")
+        sys.exit(1)
+    try:
+        written = mapparser.Map(sys.argv[1], use_snapshot=False).write_snapshot()
+    except PermissionError as e:
+        print(f"Can't replace the snapshot, stop the bot using it first: {e}")
+        sys.exit(1)
+    if not written:
+        print(f"{sys.argv[1]} was modified while being read, snapshot not written")
+        sys.exit(1)
+    print(f"Snapshot written to {get_snapshot_path(sys.argv[1])}")
@@ -0,0 +1,177 @@
+"""
+Shortest paths and distances between rooms.
+
+Rooms of a floor are the cells of its floor layer (`пол`) that aren't abyss,
+rooms are connected if there's a door between them (see mapparser.Map.get_door_masks).
+Graphs and query results are cached per floor and map version.
+"""
+from __future__ import annotations
+from typing import Iterable, Union
+from collections import deque
+import heapq
+import threading
+import weakref
+import floor
+import mapparser
+
+Room = tuple[int, int]
+
+# map -> floor -> graph, entries are dropped with the map
+_graphs: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_graphs_lock = threading.Lock()
+
+
+class FloorGraph:
+    """
+    Room graph of a floor
+    """
+    def __init__(self, game_map: mapparser.Map, fl: floor.Floor):
+        """
+        :param game_map: the map
+        :param fl: the floor
+        """
+        self.floor = fl
+        startX, startY, width, masks = game_map.get_door_masks(fl)
+        grid = game_map.get_floor_grid(fl)
+        gridWidth = fl.size[0] // 32
+        # room -> door bitmask, see mapparser.Map.DOORS
+        self.__doors: dict[Room, int] = {}
+        # room -> tile ID
+        self.__tiles: dict[Room, int] = {}
+        for index, tile in enumerate(grid):
+            if tile in (mapparser.TileIDs.NULL.value, mapparser.TileIDs.ABYSS.value):
+                continue
+            x, y = fl.start[0] // 32 + index % gridWidth, fl.start[1] // 32 + index // gridWidth
+            self.__tiles[(x, y)] = tile
+            self.__doors[(x, y)] = masks[(y - startY) * width + x - startX]
+        self.__neighbours: dict[Room, list[Room]] = {
+            room: [(room[0] + dx, room[1] + dy)
+                   for bit, (_, dx, dy) in enumerate(mapparser.Map.DOORS)
+                   if mask & (1 << bit) and (room[0] + dx, room[1] + dy) in self.__doors]
+            for room, mask in self.__doors.items()
+        }
+        # sources -> distance field, (start, goal) -> path
+        self.__distances: dict[frozenset[Room], dict[Room, int]] = {}
+        self.__paths: dict[tuple[Room, Room], Union[list[Room], None]] = {}
+
+    def __contains__(self, room: Room) -> bool:
+        return room in self.__neighbours
+
+    def neighbours(self, room: Room) -> list[Room]:
+        """
+        Get the rooms connected to a room by doors
+
+        :param room: room position (in tiles)
+        :return: neighbouring rooms, in the order doors are listed
+        """
+        return self.__neighbours.get(room, [])
+
+    def rooms_with(self, tile: mapparser.TileIDs) -> list[Room]:
+        """
+        Get the rooms of a given type, e.g. all merchants of the floor
+
+        :param tile: the room type
+        :return: rooms, row by row
+        """
+        return [room for room, roomTile in self.__tiles.items() if roomTile == tile.value]
+
+    def distances(self, sources: Iterable[Room]) -> dict[Room, int]:
+        """
+        Get the distance from every room to the nearest of the sources (breadth-first search)
+
+        :param sources: rooms to measure the distance from
+        :return: number of doors to go through, unreachable rooms are not included
+        """
+        sources = frozenset(room for room in sources if room in self)
+        field = self.__distances.get(sources)
+        if field is not None:
+            return field
+        field = {room: 0 for room in sources}
+        queue = deque(sources)
+        while queue:
+            room = queue.popleft()
+            for neighbour in self.__neighbours[room]:
+                if neighbour not in field:
+                    field[neighbour] = field[room] + 1
+                    queue.append(neighbour)
+        self.__distances[sources] = field
+        return field
+
+    def path(self, start: Room, goal: Room) -> Union[list[Room], None]:
+        """
+        Find the shortest path between two rooms (A* search)
+
+        :param start: room to start from
+        :param goal: room to get to
+        :return: rooms of the path including start and goal or None if goal can't be reached
+        """
+        key = (start, goal)
+        if key in self.__paths:
+            return self.__paths[key]
+        path = None
+        if start in self and goal in self:
+            cameFrom: dict[Room, Union[Room, None]] = {start: None}
+            cost = {start: 0}
+            queue = [(abs(start[0] - goal[0]) + abs(start[1] - goal[1]), 0, start)]
+            while queue:
+                _, roomCost, room = heapq.heappop(queue)
+                if room == goal:
+                    path = []
+                    while room is not None:
+                        path.append(room)
+                        room = cameFrom[room]
+                    path.reverse()
+                    break
+                if roomCost > cost[room]:
+                    continue
+                for neighbour in self.__neighbours[room]:
+                    if neighbour not in cost or roomCost + 1 < cost[neighbour]:
+                        cost[neighbour] = roomCost + 1
+                        cameFrom[neighbour] = room
+                        estimate = abs(neighbour[0] - goal[0]) + abs(neighbour[1] - goal[1])
+                        heapq.heappush(queue, (roomCost + 1 + estimate, roomCost + 1, neighbour))
+        self.__paths[key] = path
+        return path
+
+    def nearest_path(self, start: Room, goals: Iterable[Room]) -> Union[list[Room], None]:
+        """
+        Find the shortest path from a room to the nearest of the goals
+
+        :param start: room to start from
+        :param goals: rooms to get to
+        :return: rooms of the path including start and goal or None if no goal can be reached
+        """
+        field = self.distances(goals)
+        if start not in field:
+            return None
+        path = [start]
+        while field[path[-1]] > 0:
+            # any neighbour one door closer leads to a nearest goal
+            path.append(next(neighbour for neighbour in self.__neighbours[path[-1]]
+                             if field.get(neighbour) == field[path[-1]] - 1))
+        return path
+
+
+def get_floor_graph(game_map: mapparser.Map, fl: floor.Floor) -> FloorGraph:
+    """
+    Get the room graph of a floor, built once per floor and map version
+
+    :param game_map: the map
+    :param fl: the floor
+    """
+    with _graphs_lock:
+        graphs = _graphs.setdefault(game_map, {})
+        graph = graphs.get(fl)
+        if graph is None:
+            graph = graphs[fl] = FloorGraph(game_map, fl)
+        return graph
+
+def get_directions(path: list[Room]) -> list[str]:
+    """
+    Get the doors to go through to follow a path
+
+    :param path: rooms of the path
+    :return: door directions, e.g. `["север", "восток"]`
+    """
+    directions = {(dx, dy): direction for direction, dx, dy in mapparser.Map.DOORS}
+    return [directions[(b[0] - a[0], b[1] - a[1])] for a, b in zip(path, path[1:])]
@@ -1,9 +1,26 @@
 from __future__ import annotations
 import re
+import functools
+from typing import Union
 from colorama import Fore, Style
 
 
 class Player:
+    """
+    A player character.
+
+    Inventory and abilities are parsed from the raw map properties on first access
+    when the player is created with `Player.from_properties`, so commands that only need
+    e.g. HP or level don't pay for them.
+    """
+    # fields passed to the constructor, in order
+    FIELDS = ("position", "name", "inventory", "HP", "maxHP", "trueHP", "MP", "maxMP", "trueMP",
+              "SP", "level", "frags", "active_abilities", "passive_abilities", "rerolls",
+              "group", "isBlind", "isDead")
+    __slots__ = ("position", "name", "HP", "maxHP", "trueHP", "MP", "maxMP", "trueMP",
+                 "SP", "level", "frags", "rerolls", "group", "isBlind", "isDead",
+                 "__inventory", "__active_abilities", "__passive_abilities", "__props")
+
     def __init__(self,
                  position:          list[int], # [x, y]
                  name:              str,
@@ -26,7 +43,7 @@ class Player:
         ):
         self.position = position
         self.name = name
-        self.inventory = inventory
+        self.__inventory = inventory
         self.HP = HP
         self.maxHP = maxHP
         self.trueHP = trueHP
@@ -36,12 +53,79 @@ class Player:
         self.SP = SP
         self.level = level
         self.frags = frags
-        self.active_abilities = active_abilities
-        self.passive_abilities = passive_abilities
+        self.__active_abilities = active_abilities
+        self.__passive_abilities = passive_abilities
         self.rerolls = rerolls
         self.group = group
         self.isBlind = isBlind
         self.isDead = isDead
+        # raw map properties of the lazily parsed fields
+        self.__props: dict[str, str] = {}
+
+    @classmethod
+    def from_properties(cls, position: list, name: str, obj_class: str, props: dict[str, str]) -> Player:
+        """
+        Create a player from a map object, expensive fields are parsed on first access
+
+        :param position: position of the object
+        :param name: name of the object
+        :param obj_class: class of the object
+        :param props: properties of the object
+        """
+        hpString = props.get("Очки Здоровья", "100/100 (100)")
+        mpString = props.get("Очки Маны", "100/100 (100)")
+        pl = cls(
+            position=position,
+            name=name,
+            inventory=None,
+            HP=int(hpString.split()[0].split("/")[0]),
+            maxHP=float(hpString.split()[0].split("/")[1]),
+            trueHP=int(hpString.split()[1][1:-1]),
+            MP=int(mpString.split()[0].split("/")[0]),
+            maxMP=float(mpString.split()[0].split("/")[1]),
+            trueMP=int(mpString.split()[1][1:-1]),
+            SP=float(props.get("Очки Души", "3")),
+            level=int(props.get("Уровень", "1")),
+            frags=props.get("Фраги", "0/4"),
+            active_abilities=None,
+            passive_abilities=None,
+            rerolls=int(props.get("Рероллы", "2")),
+            group=props.get("Группа", ""),
+            isBlind=props.get("Ослеплён", "false").lower() in ["true", "1"],
+            isDead=(obj_class or "Игрок").lower() == "труп"
+        )
+        pl.__props = props
+        return pl
+
+    @property
+    def inventory(self) -> list[str]:
+        if self.__inventory is None:
+            self.__inventory = Player.format_inventory_list(self.__props.get("Инвентарь", "").split("\n"))
+        return self.__inventory
+
+    @inventory.setter
+    def inventory(self, value: list[str]):
+        self.__inventory = value
+
+    @property
+    def active_abilities(self) -> list[str]:
+        if self.__active_abilities is None:
+            self.__active_abilities = self.__props.get("Навыки", "").split("\n")
+        return self.__active_abilities
+
+    @active_abilities.setter
+    def active_abilities(self, value: list[str]):
+        self.__active_abilities = value
+
+    @property
+    def passive_abilities(self) -> list[str]:
+        if self.__passive_abilities is None:
+            self.__passive_abilities = self.__props.get("Особенности", "").split("\n")
+        return self.__passive_abilities
+
+    @passive_abilities.setter
+    def passive_abilities(self, value: list[str]):
+        self.__passive_abilities = value
 
     def __str__(self):
         return f"Player: {self.name}"
@@ -62,62 +146,107 @@ class Player:
     def format_inventory_list(inventory: list, show_equipped_only: bool = False) -> list:
         """
         Formats inventory for ANSI display
+        Formatted items are cached, see `Player.inventory_cache_info`
 
         :param inventory: list of items
         :param show_equipped_only: show only equipped items
         :return: list of formatted items
         """
-        def replacer(match):
-            if match.group(1) is not None:
-                return "?"
-            if match.group(2) is not None:
-                return "???,"
-            if match.group(3) is not None:
-                return "???}"
-
         formatted_inventory = []
 
         for item in inventory:
-            equipped_item_regex = r"(\d+э)\."
             if show_equipped_only:
-                if not re.findall(equipped_item_regex, item):
-                    continue
-                else:
-                    item_name = re.findall(r"э.([\W].+?) [\ |\(|\{|\n]", item)[0][1::]
+                item_name = _get_equipped_item_name(item)
+                if item_name is not None:
                     formatted_inventory.append(item_name)
-                    continue
-
-            item = item.replace("&lt;", "<")
-            item = item.replace("&gt;", ">")
-            # replacing hidden properties with `???`
-            # (or `?`, if the property partially disclosed)
-            item = re.sub(r"\?{3}(\(.*?\))|\?{3}([^,}]*),|\?{3}(.+?)}", replacer, item)
-            item = re.sub(r"([^ {]+)\?{3}", r"\1?", item)
-            # hiding actual item name
-            item = re.sub(r"\(.+?\)", "", item.split("{")[0]) + item[item.find("{")::] if item.find("{") != -1 else item
-            item = item.replace("  ", " ")
-
-            # colorize inventory items
-            # checking if item equipped
-            item = re.sub(equipped_item_regex, rf"{Fore.GREEN}\1{Style.RESET_ALL}.", item)
-
-            # colorizing hidden properties
-            item = re.sub(r"\?{3}", f"{Fore.MAGENTA}???{Style.RESET_ALL}", item)
-
-            # colorizing durability (if its less than 25%)
-            durability_search_regex = r"(\([0-9]+?\/[0-9]+?\))"
-            durability = re.findall(durability_search_regex, item)
-            if durability:
-                itemDurability, itemMaxDurability = [int(i) for i in durability[0].replace("(", "").replace(")", "").split("/")]
-                if itemDurability / itemMaxDurability <= 0.25:
-                    item = re.sub(durability_search_regex, Fore.RED + r"\1" + Style.RESET_ALL, item)
-
-            # colorize price
-            item = re.sub(r"([0-9]+?ж)", Fore.YELLOW + r"\1" + Style.RESET_ALL, item)
-
-            formatted_inventory.append(item)
+                continue
+            formatted_inventory.append(_format_item(item))
 
         return formatted_inventory \
                or \
                [f"В инвентаре {Fore.RED}нет{Style.RESET_ALL} предметов" if not show_equipped_only
                 else f"В инвентаре {Fore.RED}нет{Style.RESET_ALL} экипированных предметов"]
+
+    @staticmethod
+    def inventory_cache_info() -> dict[str, Union[int, float]]:
+        """
+        Statistics of the formatted items cache
+
+        :return: dict with `hits`, `misses`, `size` and `hit_rate`
+        """
+        hits = misses = size = 0
+        for cache in (_format_item, _get_equipped_item_name):
+            info = cache.cache_info()
+            hits += info.hits
+            misses += info.misses
+            size += info.currsize
+        return {
+            "hits": hits,
+            "misses": misses,
+            "size": size,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0
+        }
+
+
+EQUIPPED_ITEM_REGEX = re.compile(r"(\d+э)\.")
+EQUIPPED_ITEM_NAME_REGEX = re.compile(r"э.([\W].+?) [\ |\(|\{|\n]")
+HIDDEN_PROPERTY_REGEX = re.compile(r"\?{3}(\(.*?\))|\?{3}([^,}]*),|\?{3}(.+?)}")
+PARTIALLY_HIDDEN_PROPERTY_REGEX = re.compile(r"([^ {]+)\?{3}")
+REAL_ITEM_NAME_REGEX = re.compile(r"\(.+?\)")
+DURABILITY_REGEX = re.compile(r"\(([0-9]+?)\/([0-9]+?)\)")
+# equipped mark, hidden property and price are colorized in a single pass
+COLORIZE_REGEX = re.compile(r"(\d+э)\.|(\?{3})|([0-9]+?ж)")
+
+def _hidden_property_replacer(match: re.Match) -> str:
+    if match.group(1) is not None:
+        return "?"
+    if match.group(2) is not None:
+        return "???,"
+    if match.group(3) is not None:
+        return "???}"
+
+def _colorize_replacer(match: re.Match) -> str:
+    if match.group(1) is not None:
+        # equipped item
+        return f"{Fore.GREEN}{match.group(1)}{Style.RESET_ALL}."
+    if match.group(2) is not None:
+        # hidden property
+        return f"{Fore.MAGENTA}???{Style.RESET_ALL}"
+    # price
+    return Fore.YELLOW + match.group(3) + Style.RESET_ALL
+
+@functools.lru_cache(maxsize=4096)
+def _get_equipped_item_name(item: str) -> Union[str, None]:
+    """
+    Get the name of an equipped item
+
+    :return: the name or None if the item is not equipped
+    """
+    if not EQUIPPED_ITEM_REGEX.search(item):
+        return None
+    return EQUIPPED_ITEM_NAME_REGEX.findall(item)[0][1::]
+
+@functools.lru_cache(maxsize=4096)
+def _format_item(item: str) -> str:
+    """
+    Format a single inventory item for ANSI display
+    """
+    item = item.replace("&lt;", "<")
+    item = item.replace("&gt;", ">")
+    # replacing hidden properties with `???`
+    # (or `?`, if the property partially disclosed)
+    item = HIDDEN_PROPERTY_REGEX.sub(_hidden_property_replacer, item)
+    item = PARTIALLY_HIDDEN_PROPERTY_REGEX.sub(r"\1?", item)
+    # hiding actual item name
+    item = REAL_ITEM_NAME_REGEX.sub("", item.split("{")[0]) + item[item.find("{")::] if item.find("{") != -1 else item
+    item = item.replace("  ", " ")
+
+    # colorizing durability (if its less than 25%)
+    durability = DURABILITY_REGEX.search(item)
+    if durability:
+        itemDurability, itemMaxDurability = int(durability.group(1)), int(durability.group(2))
+        if itemDurability / itemMaxDurability <= 0.25:
+            item = DURABILITY_REGEX.sub(lambda match: Fore.RED + match.group(0) + Style.RESET_ALL, item)
+
+    # colorize equipped mark, hidden properties and price
+    return COLORIZE_REGEX.sub(_colorize_replacer, item)
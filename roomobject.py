@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Union
 
 @dataclass
@@ -8,6 +8,21 @@ class RoomObject:
     size: tuple[int, int]
     obj_class: str
     layer: Union[str, int]
+    # visibility data, not a part of the object's identity
+    hidden: bool = field(default=False, compare=False, repr=False)
+    owner: str = field(default="", compare=False, repr=False)
+    group: str = field(default="", compare=False, repr=False)
+
+    def is_visible_to(self, player) -> bool:
+        """
+        Check if the object can be seen by the player
+
+        :param player: the player in question
+        """
+        return (not self.hidden) or \
+               (self.owner != "" and self.owner == player.name) or \
+               (self.group != "" and self.group == player.group) or \
+               (self.name != "???" and self.name == player.name)
 
     def __post_init__(self):
         if isinstance(self.layer, str):
@@ -0,0 +1,118 @@
+from __future__ import annotations
+from typing import Awaitable, Callable, Union
+import discord
+
+Handler = Callable[[discord.Message, list[str]], Awaitable[None]]
+Check = Callable[[Union[discord.User, discord.Member], str], bool]
+
+
+class CommandRouter:
+    """
+    Routes messages to command handlers.
+
+    Command names are stored in a trie, so a message is matched against all commands
+    in a single walk over its first characters and the longest matching name wins
+    (`кто я` is preferred over `кто`). Matching is case-insensitive, like
+    `message.content.lower().startswith(prefix + name)`.
+
+    Messages that can't be commands (no prefix, sent by bots or webhooks,
+    or posted outside of the allowed channels) are dropped before any routing.
+
+    Restricted commands are only run for users the `allows` check passes.
+    """
+    def __init__(self, prefix: str, channels: frozenset[int] = frozenset(), allows: Check = None):
+        """
+        :param prefix: command prefix
+        :param channels: IDs of guild channels to accept commands from, empty to accept from all
+        :param allows: check whether a user may run a restricted command, gets the user and
+        the first name of the command
+        """
+        self.prefix = prefix
+        self.channels = channels
+        self.allows = allows
+        # messages dropped by the filter and messages passed to a handler
+        self.filtered = 0
+        self.routed = 0
+        self.__cased_prefix = prefix.lower() != prefix.upper()
+        self.__trie: dict = {}
+
+    def command(
+            self,
+            *names: str,
+            restricted: bool = False,
+            deny: str = None
+        ) -> Callable[[Handler], Handler]:
+        """
+        Register a handler for one or more command names
+
+        :param names: command names without the prefix
+        :param restricted: only run the handler for users the `allows` check passes
+        :param deny: message to reply with to other users, nothing is sent if `None`
+        """
+        def decorator(handler: Handler) -> Handler:
+            routed = self.__restrict(handler, names[0], deny) if restricted else handler
+            for name in names:
+                node = self.__trie
+                for char in name.lower():
+                    node = node.setdefault(char, {})
+                node[None] = routed
+            return handler
+        return decorator
+
+    def __restrict(self, handler: Handler, name: str, deny: Union[str, None]) -> Handler:
+        async def restricted(message: discord.Message, args: list[str]):
+            if self.allows is None or not self.allows(message.author, name):
+                if deny is not None:
+                    await message.channel.send(deny)
+                return
+            await handler(message, args)
+        return restricted
+
+    def resolve(self, content: str) -> Union[Handler, None]:
+        """
+        Find the handler for a message
+
+        :param content: message content
+        :return: handler of the longest command name the message starts with or None
+        """
+        if content[:len(self.prefix)].lower() != self.prefix:
+            return None
+        handler = None
+        node = self.__trie
+        for char in content[len(self.prefix):]:
+            node = node.get(char.lower())
+            if node is None:
+                break
+            handler = node.get(None, handler)
+        return handler
+
+    def accepts(self, message: discord.Message) -> bool:
+        """
+        Cheap checks whether a message may be a command for the bot
+
+        :param message: the message
+        """
+        content = message.content
+        if not content.startswith(self.prefix) and \
+           (not self.__cased_prefix or content[:len(self.prefix)].lower() != self.prefix):
+            return False
+        if message.author.bot or message.webhook_id is not None:
+            return False
+        if self.channels and message.guild is not None and message.channel.id not in self.channels:
+            return False
+        return True
+
+    async def dispatch(self, message: discord.Message) -> bool:
+        """
+        Run the handler for a message, if there is one
+
+        :param message: the message
+        :return: `True` if the message was routed to a handler
+        """
+        handler = self.resolve(message.content) if self.accepts(message) else None
+        if handler is None:
+            self.filtered += 1
+            return False
+        self.routed += 1
+        await handler(message, message.content.split())
+        return True
@@ -0,0 +1,144 @@
+from __future__ import annotations
+from typing import Any, Callable, Union
+import json
+import os
+import threading
+
+
+class JsonStore:
+    """
+    Write-behind storage of a JSON document.
+
+    Writes are coalesced: any number of changes within `delay` seconds result in
+    a single write, done in a background thread to a temporary file that then
+    replaces the document, so a crash never leaves a half-written file.
+
+    With the journal enabled, changes are instead appended to `<filename>.journal`
+    as JSON lines by the same delayed background write, and the document itself is
+    only rewritten (compacted) after `compact_every` changes or on flush(). Journal
+    entries must be idempotent, as entries already included in the document can be
+    replayed after a crash.
+
+    The calling thread never waits for file I/O, except in flush().
+    """
+    def __init__(
+            self,
+            filename: str,
+            dump: Callable[[], Any],
+            delay: float = 1.0,
+            journal: bool = False,
+            compact_every: int = 100
+        ):
+        """
+        :param filename: path to the JSON document
+        :param dump: returns the current data to write
+        :param delay: seconds to wait for more changes before writing
+        :param journal: append changes to a journal instead of rewriting the document
+        :param compact_every: number of journal entries after which the document is rewritten
+        """
+        self.filename = filename
+        self.journal_filename = filename + ".journal"
+        self.delay = delay
+        self.journal = journal
+        self.compact_every = compact_every
+        self.__dump = dump
+        # guards the timer and the pending entries, never held during file I/O
+        self.__lock = threading.Lock()
+        self.__write_lock = threading.Lock()
+        self.__timer: Union[threading.Timer, None] = None
+        self.__journal_entries = 0
+        # journal entries not yet written
+        self.__pending: list = []
+
+    def read(self, default: Any) -> tuple[Any, list]:
+        """
+        Read the document and the journal entries not yet compacted into it
+
+        :param default: data to use if there is no document yet
+        :return: data and journal entries, oldest first
+        """
+        if os.path.exists(self.filename):
+            with open(self.filename, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        else:
+            data = default
+
+        entries = []
+        for filename in (self.journal_filename + ".compacting", self.journal_filename):
+            if not os.path.exists(filename):
+                continue
+            with open(filename, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # an entry torn by a crash, nothing after it was written
+                        break
+        self.__journal_entries = len(entries)
+        return data, entries
+
+    def append(self, entry: Any):
+        """
+        Record a change and schedule a write. With the journal enabled the entry
+        is appended to the journal by the write
+
+        :param entry: JSON-serializable description of the change
+        """
+        if self.journal:
+            with self.__lock:
+                self.__pending.append(entry)
+                self.__journal_entries += 1
+        self.schedule()
+
+    def schedule(self):
+        """
+        Write after `delay` seconds, unless a write is already pending
+        """
+        with self.__lock:
+            if self.__timer is not None:
+                return
+            self.__timer = threading.Timer(self.delay, self.__write)
+            self.__timer.start()
+
+    def flush(self):
+        """
+        Write the document right now and cancel the pending write
+        """
+        with self.__lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+        self.__write(compact=True)
+
+    def __write(self, compact: bool = False):
+        # only one write at a time, the state lock is held just to take what to write
+        with self.__write_lock:
+            with self.__lock:
+                self.__timer = None
+                entries, self.__pending = self.__pending, []
+                compact = compact or not self.journal or self.__journal_entries >= self.compact_every
+                if compact:
+                    data = self.__dump()
+                    self.__journal_entries = 0
+
+            if entries:
+                with open(self.journal_filename, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+                    f.flush()
+                    os.fsync(f.fileno())
+            if not compact:
+                return
+
+            compacting = self.journal_filename + ".compacting"
+            # also a journal left over from before the journal was turned off
+            if os.path.exists(self.journal_filename):
+                # entries of later writes go to a fresh journal
+                os.replace(self.journal_filename, compacting)
+            tmp_filename = self.filename + ".tmp"
+            with open(tmp_filename, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_filename, self.filename)
+            if os.path.exists(compacting):
+                os.remove(compacting)
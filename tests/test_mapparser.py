@@ -1,5 +1,9 @@
 import sys
 import os
+import shutil
+import copy
+import asyncio
+import tempfile
 from colorama import Fore, Back, Style
 
 # prepare sys.path for importing modules from parent directory
@@ -8,6 +12,7 @@ parent = os.path.dirname(current)
 sys.path.append(parent)
 
 import mapparser
+import mapsnapshot
 import unittest
 import player
 import roomobject
@@ -56,9 +61,18 @@ class TestMapParser(unittest.TestCase):
             isBlind = False,
             isDead = False
         )
-        for attr in testPlayerGot.__dict__:
+        for attr in player.Player.FIELDS:
             self.assertEqual(getattr(testPlayerGot, attr), getattr(testPlayerActual, attr))
 
+    def test_get_players(self):
+        players, errors = self.map.get_players([("test_player1", 1), ("not_found", 1), ("test_player2", 1)])
+        self.assertIs(players[0], self.map.get_player("test_player1", 1))
+        self.assertIsNone(errors[0])
+        self.assertIsNone(players[1])
+        self.assertIsInstance(errors[1], mapparser.MapObjectNotFoundException)
+        self.assertIsNone(players[2])
+        self.assertIsInstance(errors[2], mapparser.MapObjectWrongIDException)
+
     def test_get_same_room_objects(self):
         testPlayer = self.map.get_player("test_player1", 1)
         objectsGot = self.map.get_same_room_objects(testPlayer)
@@ -158,6 +172,20 @@ S: something
 """
         self.assertEqual(asciiGot, asciiActual)
 
+    def test_room_render_cache(self):
+        testPlayer = self.map.get_player("test_player1", 1)
+        asciiGot = self.map.construct_ascii_room(testPlayer)
+        self.assertIs(self.map.construct_ascii_room(testPlayer), asciiGot)
+        self.assertEqual(mapparser.Map(os.path.join(current, "test.tmx")).construct_ascii_room(testPlayer),
+                         asciiGot)
+        # viewers nothing in the room depends on share the render
+        firstViewer = copy.copy(testPlayer)
+        firstViewer.name = "first_viewer"
+        secondViewer = copy.copy(testPlayer)
+        secondViewer.name = "second_viewer"
+        self.assertIs(self.map.construct_ascii_room(firstViewer), self.map.construct_ascii_room(secondViewer))
+        self.assertNotEqual(self.map.construct_ascii_room(firstViewer), asciiGot)
+
     def test_list_doors_string(self):
         testPlayer = self.map.get_player("test_player1", 1)
         self.assertEqual(self.map.list_doors_string(testPlayer), "В этой комнате нет дверей.")
@@ -221,6 +249,26 @@ S: something
 """
         self.assertEqual(asciiGot, asciiActual)
 
+    def test_construct_ascii_map_explored(self):
+        testPlayer = self.map.get_player("test_player10", 10)
+        self.assertEqual(self.map.construct_ascii_map(testPlayer, 1, explored=(1 << 15) - 1),
+                         self.map.construct_ascii_map(testPlayer, 1))
+        asciiGot = self.map.construct_ascii_map(testPlayer, 1, explored=0b110010)
+        asciiActual = f"""\
+ {Back.WHITE}{Fore.BLACK}T{Style.RESET_ALL} 
+ ##
+   
+   
+   
+
+
+{Back.WHITE}{Fore.BLACK}T{Style.RESET_ALL}: test_player10
+#: ???\
+"""
+        self.assertEqual(asciiGot, asciiActual)
+        self.assertEqual(self.map.construct_ascii_map(testPlayer, 1, explored=0),
+                         "   \n" * 5 + "\n\n")
+
     def test_get_player_floor_coords(self):
         testPlayer = self.map.get_player("test_player5", 5)
         coordsGot = self.map.get_player_floor_coords(testPlayer)
@@ -269,5 +317,149 @@ S: something
         floorStringActual = 'Ты находишься на 1 этаже 4 инстанса.'
         self.assertEqual(floorStringGot, floorStringActual)
 
+class MapFileTestCase(unittest.TestCase):
+    """
+    Base for tests that modify the map, gives each test its own copy of test.tmx at `self.path`
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "test.tmx")
+        shutil.copy(os.path.join(current, "test.tmx"), self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+class TestMapProvider(MapFileTestCase):
+    def test_get_map(self):
+        provider = mapparser.MapProvider(self.path)
+        first = provider.get_map()
+        self.assertIs(provider.get_map(), first)
+        self.assertEqual((provider.hits, provider.misses), (1, 1))
+
+        # touching the file with a new mtime forces a re-parse
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertIsNot(provider.get_map(), first)
+        self.assertEqual((provider.hits, provider.misses), (1, 2))
+
+    def test_invalidate(self):
+        provider = mapparser.MapProvider(self.path)
+        first = provider.get_map()
+        provider.invalidate()
+        self.assertIsNot(provider.get_map(), first)
+        self.assertEqual(provider.misses, 2)
+
+    def test_watch(self):
+        provider = mapparser.MapProvider(self.path)
+
+        async def run():
+            watcher = asyncio.create_task(provider.watch(interval=0.01, debounce=0.01))
+            await asyncio.sleep(0.1)
+            first = provider.get_map()
+
+            # a broken save must not replace the current map
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write("<map")
+            await asyncio.sleep(0.1)
+            self.assertIs(provider.get_map(), first)
+
+            shutil.copy(os.path.join(current, "test.tmx"), self.path)
+            await asyncio.sleep(0.1)
+            second = provider.get_map()
+            watcher.cancel()
+            return first, second
+
+        with self.assertLogs("mapparser", level="WARNING"):
+            first, second = asyncio.run(run())
+        self.assertIsNot(second, first)
+        self.assertEqual(second.get_player("test_player1", 1).name, "test_player1")
+
+class TestMapReload(MapFileTestCase):
+    def test_reload(self):
+        oldMap = mapparser.Map(self.path)
+        self.assertEqual(oldMap.reload().changed_rooms, set())
+        self.assertIs(oldMap.get_player("test_player1", 1), oldMap.get_player("test_player1", 1))
+        oldRender = oldMap.construct_ascii_room(oldMap.get_player("test_player8", 8))
+
+        with open(self.path, encoding="utf-8") as f:
+            data = f.read()
+        data = data.replace('<property name="ID игрока" value="1"/>',
+                            '<property name="ID игрока" value="1"/>\n' +
+                            '    <property name="Очки Здоровья" value="50/100 (100)"/>')
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(data)
+
+        newMap = oldMap.reload()
+        self.assertEqual(newMap.changed_rooms, {(1, -7)})
+        self.assertEqual(newMap.get_player("test_player1", 1).HP, 50)
+        self.assertEqual(oldMap.get_player("test_player1", 1).HP, 100)
+        self.assertIs(newMap.get_player("test_player8", 8), oldMap.get_player("test_player8", 8))
+        self.assertEqual(newMap.get_same_room_objects(newMap.get_player("test_player1", 1)),
+                         oldMap.get_same_room_objects(oldMap.get_player("test_player1", 1)))
+        testPlayer = newMap.get_player("test_player8", 8)
+        self.assertIs(newMap.construct_ascii_room(testPlayer), oldRender)
+        self.assertEqual(newMap.construct_ascii_map(testPlayer), oldMap.construct_ascii_map(testPlayer))
+
+    def test_malformed_properties(self):
+        with open(self.path, encoding="utf-8") as f:
+            data = f.read()
+        data = data.replace('<property name="ID игрока" value="1"/>',
+                            '<property name="ID игрока" value="1"/>\n' +
+                            '    <property name="Очки Здоровья" value="много"/>')
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(data)
+
+        testMap = mapparser.Map(self.path)
+        players, errors = testMap.get_players([("test_player1", 1), ("test_player8", 8)])
+        self.assertIsNone(players[0])
+        self.assertIsInstance(errors[0], mapparser.MapObjectPropertyException)
+        self.assertIs(players[1], testMap.get_player("test_player8", 8))
+        self.assertIsNone(errors[1])
+
+        data = data.replace('value="много"', 'value="50/100 (100)"/>\n' +
+                            '    <property name="Очки Маны" value="много"')
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(data)
+        players, errors = mapparser.Map(self.path).get_players([("test_player1", 1)])
+        self.assertIsNone(players[0])
+        self.assertIsInstance(errors[0], mapparser.MapObjectPropertyException)
+
+class TestMapSnapshot(MapFileTestCase):
+    def test_snapshot(self):
+        xmlMap = mapparser.Map(self.path)
+        self.assertFalse(xmlMap.from_snapshot)
+        self.assertTrue(xmlMap.write_snapshot())
+
+        snapshotMap = mapparser.Map(self.path)
+        self.assertTrue(snapshotMap.from_snapshot)
+        for name, playerID in (("test_player1", 1), ("test_player12", 12), ("test_player13", 13)):
+            xmlPlayer = xmlMap.get_player(name, playerID)
+            snapshotPlayer = snapshotMap.get_player(name, playerID)
+            for attr in player.Player.FIELDS:
+                self.assertEqual(getattr(snapshotPlayer, attr), getattr(xmlPlayer, attr))
+            self.assertEqual(snapshotMap.construct_ascii_room(snapshotPlayer),
+                             xmlMap.construct_ascii_room(xmlPlayer))
+            self.assertEqual(snapshotMap.construct_ascii_map(snapshotPlayer, 2),
+                             xmlMap.construct_ascii_map(xmlPlayer, 2))
+            self.assertEqual(snapshotMap.list_doors_string(snapshotPlayer),
+                             xmlMap.list_doors_string(xmlPlayer))
+            self.assertEqual(snapshotMap.get_floor_string(snapshotPlayer),
+                             xmlMap.get_floor_string(xmlPlayer))
+
+    def test_stale_snapshot(self):
+        mapparser.Map(self.path).write_snapshot()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n")
+        self.assertFalse(mapparser.Map(self.path).from_snapshot)
+
+    def test_modified_before_snapshot(self):
+        oldMap = mapparser.Map(self.path)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n")
+        os.utime(self.path, (0, 0))
+        # the snapshot would carry the digest of the new file
+        self.assertFalse(oldMap.write_snapshot())
+        self.assertFalse(os.path.exists(mapsnapshot.get_snapshot_path(self.path)))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import os
+import sys
+
+
+# prepare sys.path for importing modules from parent directory
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+import mapparser
+import navigation
+import dialog_manager
+
+
+class TestNavigation(unittest.TestCase):
+    map = mapparser.Map(os.path.join(current, "test.tmx"))
+    graph = navigation.get_floor_graph(map, map.get_room_floor((0, 0)))
+
+    def test_get_floor_graph(self):
+        self.assertIs(navigation.get_floor_graph(self.map, self.map.get_room_floor((0, 0))), self.graph)
+        self.assertEqual(self.graph.floor.name, "Этаж 1-1")
+        self.assertIn((0, 0), self.graph)
+        # abyss
+        self.assertNotIn((-1, -4), self.graph)
+        self.assertEqual(self.graph.neighbours((0, 0)), [(0, -1)])
+        self.assertEqual(self.graph.neighbours((0, -2)), [(0, -3), (0, -1), (-1, -2), (1, -2)])
+        self.assertEqual(self.graph.rooms_with(mapparser.TileIDs.MERCHANT), [(-1, -2), (0, -1)])
+
+    def test_path(self):
+        path = self.graph.path((0, 0), (0, -4))
+        self.assertEqual(path, [(0, 0), (0, -1), (0, -2), (0, -3), (0, -4)])
+        self.assertIs(self.graph.path((0, 0), (0, -4)), path)
+        self.assertEqual(navigation.get_directions(path), ["север"] * 4)
+        self.assertEqual(self.graph.path((0, 0), (0, 0)), [(0, 0)])
+        self.assertIsNone(self.graph.path((0, 0), (-1, -4)))
+
+    def test_distances(self):
+        distances = self.graph.distances([(0, 0)])
+        self.assertEqual(distances[(0, -4)], 4)
+        self.assertEqual(distances[(1, -4)], 5)
+        self.assertEqual(len(distances), 10)
+        distances = self.graph.distances(self.graph.rooms_with(mapparser.TileIDs.MERCHANT))
+        self.assertEqual((distances[(0, 0)], distances[(-1, -2)], distances[(1, -4)]), (1, 0, 4))
+        self.assertEqual(self.graph.nearest_path((0, 0), [(1, -2), (1, -4)]), [(0, 0), (0, -1), (0, -2), (1, -2)])
+
+    def test_get_path_string(self):
+        self.assertEqual(dialog_manager.get_path_string(self.map, "test_player8", "Лестница вниз"),
+                         "test_player8 и Лестница вниз в одной комнате.")
+        self.assertEqual(dialog_manager.get_path_string(self.map, "test_player8", "событие"),
+                         "От test_player8 до ближайшей комнаты «событие» дверей: 3 (север, север, восток).")
+        self.assertEqual(dialog_manager.get_path_string(self.map, "test_player8", "test_player1"),
+                         "test_player8 и test_player1 находятся на разных этажах.")
+        with self.assertRaises(mapparser.MapObjectNotFoundException):
+            dialog_manager.get_path_string(self.map, "test_player8", "nonexistent")
+
+
+if __name__ == '__main__':
+    unittest.main()
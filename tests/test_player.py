@@ -1,6 +1,7 @@
 import unittest
 import os
 import sys
+from colorama import Fore, Style
 
 
 # prepare sys.path for importing modules from parent directory
@@ -51,6 +52,16 @@ class TestPlayer(unittest.TestCase):
             ]
         )
 
+    def test_inventory_cache_info(self):
+        item = "1э. cached test item {???, shown} (1/10) за 5ж"
+        before = player.Player.inventory_cache_info()
+        first = player.Player.format_inventory_list([item])
+        self.assertEqual(player.Player.format_inventory_list([item]), first)
+        after = player.Player.inventory_cache_info()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+        self.assertTrue(0 < after["hit_rate"] <= 1)
+
     def test_format_stats(self):
         self.assertEqual(self.gameMap.get_player("test_player9", 9).format_HP(), "100/100.0 (100)")
         self.assertEqual(self.gameMap.get_player("test_player11", 11).format_HP(), "127/151.3 (154)")
@@ -66,5 +77,19 @@ class TestPlayer(unittest.TestCase):
                             "карта": 2
                          })
 
+    def test_lazy_fields(self):
+        lazyPlayer = player.Player.from_properties(["0", "0"], "lazy_player", "Игрок", {
+            "Очки Здоровья": "10/20 (30)",
+            "Инвентарь": "1э. lazy item (1/1)",
+            "Навыки": "skill 1\nskill 2"
+        })
+        self.assertFalse(hasattr(lazyPlayer, "__dict__"))
+        self.assertEqual(lazyPlayer.format_HP(), "10/20.0 (30)")
+        self.assertEqual(lazyPlayer.inventory, [f"{Fore.GREEN}1э{Style.RESET_ALL}. lazy item (1/1)"])
+        self.assertEqual(lazyPlayer.active_abilities, ["skill 1", "skill 2"])
+        self.assertEqual(lazyPlayer.passive_abilities, [""])
+        lazyPlayer.inventory = []
+        self.assertEqual(lazyPlayer.inventory, [])
+
 if __name__ == '__main__':
     unittest.main()
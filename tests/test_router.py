@@ -0,0 +1,107 @@
+import unittest
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+
+# prepare sys.path for importing modules from parent directory
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+import config
+import router
+
+
+commandRouter = router.CommandRouter(".")
+
+@commandRouter.command("кто")
+async def who(message, args):
+    ...
+
+@commandRouter.command("кто я", "я кто")
+async def whoami(message, args):
+    ...
+
+def make_message(content, bot=False, webhook_id=None, channel_id=1, guild=True, author_id=0, roles=(), sent=None):
+    async def send(text):
+        sent.append(text)
+
+    return SimpleNamespace(
+        content=content,
+        author=SimpleNamespace(bot=bot, id=author_id, roles=[SimpleNamespace(id=role) for role in roles]),
+        webhook_id=webhook_id,
+        channel=SimpleNamespace(id=channel_id, send=send),
+        guild=SimpleNamespace() if guild else None
+    )
+
+class TestCommandRouter(unittest.TestCase):
+    def test_resolve(self):
+        self.assertIs(commandRouter.resolve(".кто я"), whoami)
+        self.assertIs(commandRouter.resolve(".КТО Я и что я"), whoami)
+        self.assertIs(commandRouter.resolve(".я кто"), whoami)
+        self.assertIs(commandRouter.resolve(".кто @someone"), who)
+        self.assertIs(commandRouter.resolve(".ктоя"), who)
+        self.assertIsNone(commandRouter.resolve(".я"))
+        self.assertIsNone(commandRouter.resolve("кто я"))
+        self.assertIsNone(commandRouter.resolve("."))
+        self.assertIsNone(commandRouter.resolve(""))
+
+    def test_dispatch(self):
+        calls = []
+        showRouter = router.CommandRouter("!")
+
+        @showRouter.command("покажи")
+        async def show(message, args):
+            calls.append(args)
+
+        self.assertTrue(asyncio.run(showRouter.dispatch(make_message("!покажи  инвентарь"))))
+        self.assertFalse(asyncio.run(showRouter.dispatch(make_message("просто сообщение"))))
+        self.assertEqual(calls, [["!покажи", "инвентарь"]])
+        self.assertEqual((showRouter.routed, showRouter.filtered), (1, 1))
+
+    def test_filter(self):
+        channelRouter = router.CommandRouter(".", frozenset({1}))
+        self.assertTrue(channelRouter.accepts(make_message(".кто я")))
+        self.assertTrue(channelRouter.accepts(make_message(".кто я", channel_id=2, guild=False)))
+        self.assertFalse(channelRouter.accepts(make_message(".кто я", channel_id=2)))
+        self.assertFalse(channelRouter.accepts(make_message(".кто я", bot=True)))
+        self.assertFalse(channelRouter.accepts(make_message(".кто я", webhook_id=3)))
+        self.assertFalse(channelRouter.accepts(make_message("кто я")))
+
+        casedRouter = router.CommandRouter("bot!")
+        self.assertTrue(casedRouter.accepts(make_message("BOT!кто я")))
+
+    def test_restricted(self):
+        calls = []
+        sent = []
+        permissions = config.Config.Permissions(
+            admins=frozenset({1}),
+            admin_roles=frozenset({10}),
+            grants={"удали": frozenset({2, 20})}
+        )
+        adminRouter = router.CommandRouter(".", allows=permissions.allows)
+
+        @adminRouter.command("удали", restricted=True, deny="Нельзя.")
+        async def delete(message, args):
+            calls.append(message.author.id)
+
+        @adminRouter.command("сбрось", restricted=True)
+        async def reset(message, args):
+            calls.append(message.author.id)
+
+        asyncio.run(adminRouter.dispatch(make_message(".удали", author_id=1, sent=sent)))
+        asyncio.run(adminRouter.dispatch(make_message(".удали", author_id=3, roles=[10], sent=sent)))
+        asyncio.run(adminRouter.dispatch(make_message(".удали", author_id=2, sent=sent)))
+        asyncio.run(adminRouter.dispatch(make_message(".удали", author_id=4, roles=[20], sent=sent)))
+        asyncio.run(adminRouter.dispatch(make_message(".удали", author_id=11, sent=sent)))
+        asyncio.run(adminRouter.dispatch(make_message(".сбрось", author_id=2, sent=sent)))
+        self.assertEqual(calls, [1, 3, 2, 4])
+        self.assertEqual(sent, ["Нельзя."])
+        # partial IDs are not admins
+        self.assertFalse(permissions.is_admin(SimpleNamespace(id=11, roles=[])))
+        self.assertTrue(permissions.is_admin(SimpleNamespace(id=1)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import unittest
+import copy
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+# prepare sys.path for importing modules from parent directory
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+import config
+import exploration
+import mapparser
+import storage
+
+
+def wait_for_journal(filename, entries):
+    """
+    Wait for the background write to append the entries to the journal
+    """
+    for _ in range(500):
+        if os.path.exists(filename):
+            with open(filename, "r", encoding="utf-8") as f:
+                if len(f.readlines()) >= entries:
+                    return
+        time.sleep(0.01)
+    raise TimeoutError(f"{filename} wasn't written")
+
+
+class TempFileTestCase(unittest.TestCase):
+    """
+    Base for tests that write files, gives each test a temporary `self.filename` named FILENAME
+    """
+    FILENAME = "data.json"
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, self.FILENAME)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+
+class TestJsonStore(TempFileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = []
+
+    def test_write_behind(self):
+        dumps = []
+        def dump():
+            dumps.append(list(self.data))
+            return self.data
+
+        store = storage.JsonStore(self.filename, dump, delay=60)
+        for i in range(10):
+            self.data.append(i)
+            store.append({"op": "add", "value": i})
+        # nothing is written until the delay passes or the store is flushed
+        self.assertFalse(os.path.exists(self.filename))
+        store.flush()
+        self.assertEqual(len(dumps), 1)
+        self.assertEqual(store.read(default=None), (list(range(10)), []))
+        self.assertFalse(os.path.exists(self.filename + ".tmp"))
+
+    def test_journal(self):
+        store = storage.JsonStore(self.filename, lambda: self.data, delay=0.01, journal=True, compact_every=3)
+        store.append({"op": "add", "value": 1})
+        store.append({"op": "add", "value": 2})
+        wait_for_journal(store.journal_filename, 2)
+        # appended only, the document is not written before compaction
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertEqual(store.read(default=[]), ([], [{"op": "add", "value": 1}, {"op": "add", "value": 2}]))
+
+        # a torn entry at the end of the journal is ignored
+        with open(store.journal_filename, "a", encoding="utf-8") as f:
+            f.write('{"op": "ad')
+        self.assertEqual(len(store.read(default=[])[1]), 2)
+
+        self.data = [1, 2]
+        store.flush()
+        self.assertEqual(store.read(default=None), ([1, 2], []))
+        self.assertFalse(os.path.exists(store.journal_filename))
+
+
+class TestReactionTriggers(TempFileTestCase):
+    FILENAME = "reaction_triggers.json"
+
+    def make_config(self, journal, delay=60):
+        return config.Config.Bot(
+            token="token",
+            prefix=".",
+            admins=[],
+            channels=frozenset(),
+            reaction_data_filename=self.filename,
+            reaction_write_delay=delay,
+            reaction_journal=journal
+        )
+
+    def test_journal_replay(self):
+        botConfig = self.make_config(journal=True, delay=0.01)
+        botConfig.set_reaction_trigger(1, "👍", 10, "sub/unsub")
+        botConfig.set_reaction_trigger(1, "👎", 11, "sub/unsub")
+        botConfig.set_reaction_trigger(2, "👍", 12, "sub/unsub")
+        botConfig.remove_reaction_trigger(botConfig.search_reaction_trigger(2))
+        botConfig.write_reaction_triggers_file()
+        wait_for_journal(self.filename + ".journal", 4)
+
+        # the file itself is not rewritten, but the changes survive a restart
+        with open(self.filename, "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f), [])
+        restarted = self.make_config(journal=True)
+        self.assertEqual([trigger.message_id for trigger in restarted.reaction_triggers], [1])
+        self.assertEqual(restarted.search_reaction_trigger(1).get_data_by_emoji("👎"), (11, "sub/unsub"))
+
+        restarted.flush_reaction_triggers_file()
+        with open(self.filename, "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f), [
+                {"1": [{"👍": 10, "message": "sub/unsub"}, {"👎": 11, "message": "sub/unsub"}]}
+            ])
+        self.assertEqual(self.make_config(journal=False).search_reaction_trigger(1).emojis, ["👍", "👎"])
+
+    def test_journal_turned_off(self):
+        botConfig = self.make_config(journal=True, delay=0.01)
+        botConfig.set_reaction_trigger(1, "👍", 10, "sub/unsub")
+        botConfig.write_reaction_triggers_file()
+        wait_for_journal(self.filename + ".journal", 1)
+
+        restarted = self.make_config(journal=False)
+        restarted.remove_reaction_trigger(restarted.search_reaction_trigger(1))
+        restarted.flush_reaction_triggers_file()
+        # the old journal is compacted away and not replayed again
+        self.assertFalse(os.path.exists(self.filename + ".journal"))
+        self.assertEqual(self.make_config(journal=False).reaction_triggers, [])
+
+
+class TestExplorationStore(TempFileTestCase):
+    FILENAME = "explored_rooms.json"
+    map = mapparser.Map(os.path.join(current, "test.tmx"))
+
+    def test_visit(self):
+        store = exploration.ExplorationStore(self.filename, delay=0.01, journal=True)
+        testPlayer = self.map.get_player("test_player8", 8)
+        self.assertEqual(store.get_explored(self.map, testPlayer), 0)
+        self.assertTrue(store.visit(self.map, testPlayer))
+        self.assertFalse(store.visit(self.map, testPlayer))
+        movedPlayer = copy.copy(testPlayer)
+        movedPlayer.position = [str(int(testPlayer.position[0])), str(int(testPlayer.position[1]) - 32)]
+        self.assertTrue(store.visit(self.map, movedPlayer))
+        # rooms (0, 0) and (0, -1) of the floor starting at (-1, -4), 3 rooms wide
+        self.assertEqual(store.get_explored(self.map, testPlayer), 1 << 13 | 1 << 10)
+        self.assertEqual(store.get_explored(self.map, self.map.get_player("test_player12", 12)), 0)
+
+        wait_for_journal(self.filename + ".journal", 2)
+        restarted = exploration.ExplorationStore(self.filename, delay=60, journal=True)
+        self.assertEqual(restarted.get_explored(self.map, testPlayer), 1 << 13 | 1 << 10)
+        restarted.flush()
+        with open(self.filename, "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f), {"test_player8": {"Этаж 1-1@-1,-4,3": "2400"}})
+        self.assertEqual(exploration.ExplorationStore(self.filename).get_explored(self.map, testPlayer),
+                         1 << 13 | 1 << 10)
+
+    def test_not_on_floor(self):
+        store = exploration.ExplorationStore(self.filename, delay=60)
+        testPlayer = copy.copy(self.map.get_player("test_player8", 8))
+        testPlayer.position = ["-1000", "-1000"]
+        self.assertFalse(store.visit(self.map, testPlayer))
+        self.assertEqual(store.get_explored(self.map, testPlayer), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()